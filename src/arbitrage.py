@@ -4,32 +4,42 @@ utilizando a infraestrutura de Flash Loans da Aave.
 Versão 2.0: Implementa a otimização de quantidade com base na liquidez do mercado.
 """
 
+import logging
 import os
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from decimal import Decimal
 from eth_abi.abi import encode
+from web3.logs import DISCARD
 
 # --- Configuração de Caminhos e Importações ---
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(base_dir)
 
 from src.flash_loan import iniciar_operacao_flash_loan
-from utils.config import config
+from utils.config import config, obter_checksum
 # Funções são importadas diretamente
 from utils.liquidity_utils import (
     obter_reservas_pool_v2,
-    obter_preco_saida,
     obter_preco_saida_e_fee,
     obter_melhor_caminho_v2_e_quote,
     quote_v3_multihop,
     encode_v3_path,
+    cotar_lote,
 )
 from utils.optimization_utils import calcular_quantidade_otima
-from utils.wallet_manager import verificar_saldo_matic_suficiente, verificar_saldo_stables_minimo
-from utils.price_oracle import obter_preco_matic_em_usdc
+from utils.profit_utils import (
+    TAXA_FLASH_LOAN,
+    BPS_SCALE,
+    WEI_POR_GWEI,
+    WEI_POR_MATIC,
+    nao_cobre_taxa_flash_loan,
+)
+from utils.wallet_manager import verificar_carteira_pronta
+from utils.price_oracle import obter_preco_matic_em_usdc, sondar_custos_lucro
 from utils.gas_utils import obter_taxa_gas
-from utils.rpc_utils import maybe_failover_if_stale, maybe_return_to_preferred, record_ping, log_metrics_if_due
+from utils.rpc_utils import maybe_failover_if_stale, maybe_return_to_preferred, record_ping, log_metrics_if_due, cached_block_number, iniciar_monitor_new_heads
 
 # --- Variáveis Globais do Módulo ---
 web3 = config['web3']
@@ -39,7 +49,10 @@ dex_contracts = config['dex_contracts']
 TOKENS = config['TOKENS']
 ACTIVE_TOKENS = config.get('ACTIVE_TOKENS', list(TOKENS.values()))
 min_balance_matic = config['min_balance_matic']
-TAXA_FLASH_LOAN = Decimal("0.0009")
+# Funções e limites fixos do config resolvidos uma vez (sem lookup no dicionário por cálculo)
+from_base = config['from_base']
+to_base = config['to_base']
+GAS_LIMIT = int(config['gas_limit'])
 MIN_PROFIT_USDC = Decimal(os.getenv("MIN_PROFIT_USDC", "0"))
 # Modo seguro: evita enviar transações reais quando ativo
 DRY_RUN = os.getenv("DRY_RUN", "1").lower() in ("1", "true", "yes", "on")
@@ -48,23 +61,29 @@ TRIANGULAR_MODE = bool(config.get('triangular_mode', False))
 TRIANGULAR_ONLY = bool(config.get('triangular_only', False))
 TRIANGULAR_LOG_TOPK = int(config.get('triangular_log_topk', 3))
 
+# Pool reutilizável para varrer tokens alvo em paralelo (I/O-bound: chamadas RPC)
+_SCAN_POOL = ThreadPoolExecutor(max_workers=int(config.get('scan_workers', 4)), thread_name_prefix="scan")
+# Pool separado para cotações independentes dentro de uma tarefa de varredura
+# (submeter ao _SCAN_POOL a partir das suas próprias tarefas poderia esgotá-lo)
+_QUOTE_POOL = ThreadPoolExecutor(max_workers=int(config.get('scan_workers', 4)), thread_name_prefix="quote")
+
 # Monitor leve de saúde do RPC (detecta blocos estagnados)
 _last_block_state = {"num": None, "ts": 0.0}
 # Heurísticas anti-saturação/volatilidade
 _last_block_time = None
 _ema_block_time = None  # ms
 
+# Índice endereço (checksum) -> símbolo, construído uma vez (TOKENS já guarda endereços em checksum)
+_SIMBOLO_POR_ENDERECO = {info['address']: sym.upper() for sym, info in TOKENS.items()}
+
 def _addr_to_sym(addr: str) -> str:
     try:
-        a = web3.to_checksum_address(addr)
+        a = obter_checksum(addr)
     except Exception:
         return addr
-    for sym, info in TOKENS.items():
-        try:
-            if web3.to_checksum_address(info['address']) == a:
-                return sym.upper()
-        except Exception:
-            continue
+    sym = _SIMBOLO_POR_ENDERECO.get(a)
+    if sym is not None:
+        return sym
     return addr[:6] + "…" + addr[-4:] if addr.startswith("0x") and len(addr) > 10 else addr
 
 def calcular_lucro_liquido_esperado(
@@ -76,15 +95,20 @@ def calcular_lucro_liquido_esperado(
     """
     Calcula o lucro líquido esperado de uma operação, descontando todos os custos.
     """
-    lucro_bruto = config['from_base'](web3, lucro_bruto_base, token_emprestimo_address)
-    quantidade_emprestimo = config['from_base'](web3, quantidade_emprestimo_base, token_emprestimo_address)
+    if nao_cobre_taxa_flash_loan(lucro_bruto_base, quantidade_emprestimo_base):
+        return Decimal("-inf")
+
+    lucro_bruto = from_base(web3, lucro_bruto_base, token_emprestimo_address)
+    quantidade_emprestimo = from_base(web3, quantidade_emprestimo_base, token_emprestimo_address)
 
     custo_flash_loan = quantidade_emprestimo * TAXA_FLASH_LOAN
 
+    # Gás e preço do MATIC expirados ao mesmo tempo: renová-los numa só ida ao nó
+    sondar_custos_lucro(web3)
     # CORREÇÃO: Chamar a função obter_taxa_gas diretamente
     preco_gas_gwei = Decimal(obter_taxa_gas(web3, logger))
     # Usar override de gas units se fornecido; caso contrário, limite padrão
-    gas_limit_units = Decimal(override_gas_units if override_gas_units is not None else int(config['gas_limit']))
+    gas_limit_units = override_gas_units if override_gas_units is not None else GAS_LIMIT
     preco_matic_usdc = obter_preco_matic_em_usdc()
     
     if preco_matic_usdc == 0:
@@ -92,252 +116,267 @@ def calcular_lucro_liquido_esperado(
         custo_gas_usdc = Decimal("inf")
     else:
         # Correção: converter corretamente gwei->wei e depois wei->MATIC
-        gas_price_wei = web3.to_wei(preco_gas_gwei, 'gwei')
-        custo_gas_wei = int(gas_limit_units) * int(gas_price_wei)
-        custo_gas_matic = web3.from_wei(custo_gas_wei, 'ether')
+        gas_price_wei = int(preco_gas_gwei * WEI_POR_GWEI)
+        custo_gas_wei = int(gas_limit_units) * gas_price_wei
+        custo_gas_matic = Decimal(custo_gas_wei) / WEI_POR_MATIC
         custo_gas_usdc = custo_gas_matic * preco_matic_usdc
 
     lucro_liquido = lucro_bruto - custo_flash_loan - custo_gas_usdc
-    
-    logger.debug(f"Cálculo de Lucro: Bruto={lucro_bruto:.4f}, Custo FlashLoan={custo_flash_loan:.4f}, Custo Gás={custo_gas_usdc:.4f} -> Líquido={lucro_liquido:.4f}")
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Cálculo de Lucro: Bruto=%.4f, Custo FlashLoan=%.4f, Custo Gás=%.4f -> Líquido=%.4f",
+            lucro_bruto, custo_flash_loan, custo_gas_usdc, lucro_liquido
+        )
 
     return lucro_liquido
 
 
-def identificar_melhor_oportunidade(token_emprestimo: str):
+def _lucros_da_grade(dex_compra_nome: str, dex_venda_nome: str, token_emprestimo: str, token_alvo: str, quantidades: list[int]) -> list[tuple[int, Decimal]]:
     """
-    Identifica a melhor oportunidade de arbitragem, calculando a quantidade ótima
-    e o lucro líquido esperado para cada par.
+    Lucro líquido estimado de cada quantidade da grade (apenas as lucrativas).
+    Cada perna cota a grade inteira num único lote Multicall3 em vez de uma RPC por quantidade.
+    """
+    outs1 = cotar_lote([(dex_compra_nome, token_emprestimo, token_alvo, q) for q in quantidades])
+    validos = [(q, out1) for q, out1 in zip(quantidades, outs1) if out1 > 0]
+    outs2 = cotar_lote([(dex_venda_nome, token_alvo, token_emprestimo, out1) for _, out1 in validos])
+    lucros = []
+    for (q, _), out2 in zip(validos, outs2):
+        lucro_bruto_base = out2 - q
+        if out2 <= 0 or lucro_bruto_base <= 0:
+            continue
+        lucros.append((q, calcular_lucro_liquido_esperado(lucro_bruto_base, q, token_emprestimo)))
+    return lucros
+
+
+def _avaliar_token_alvo(token_emprestimo: str, token_alvo: str, inicio: float, budget_sec: int):
+    """
+    Avalia todas as combinações de DEX compra/venda para um token alvo.
+    Executada em paralelo (uma tarefa por token) a partir de identificar_melhor_oportunidade.
+
+    Returns:
+        (candidatos, melhor_oportunidade, melhor_lucro_liquido, timeout)
     """
     melhor_oportunidade = None
     melhor_lucro_liquido = Decimal(0)
-    candidatos = []  # coleta para TOP3
-
-    # Orçamento de tempo por varredura
-    try:
-        # Padrão mais generoso para suportar V3 multi-hop; permite override por ENV
-        default_budget = int(config.get('scan_time_budget_seconds', 120))
-        budget_sec = int(os.getenv('SCAN_TIME_BUDGET_SECONDS', str(default_budget)))
-    except Exception:
-        budget_sec = int(config.get('scan_time_budget_seconds', 120))
-    inicio = time.time()
+    candidatos = []
     timeout = False
 
-    for token_alvo_info in ACTIVE_TOKENS:
-        if token_alvo_info['address'] == token_emprestimo:
-            continue
+    dexs_v2 = [dex for dex in dex_contracts if "V2" in dex]
+    dexs_compra = dexs_v2 + ["UniswapV3"]
+    dexs_venda = dexs_v2 + ["UniswapV3"]
+    # Reservas de cada pool V2 lidas uma única vez: o mesmo estado serve às duas
+    # direções (compra/venda), em vez de uma leitura por combinação ordenada de DEXs.
+    futuros_reservas = {dex: _QUOTE_POOL.submit(obter_reservas_pool_v2, dex, token_emprestimo, token_alvo) for dex in dexs_v2}
+    reservas_v2 = {dex: futuro.result() for dex, futuro in futuros_reservas.items()}
+    for dex_compra_nome in dexs_compra:
         if time.time() - inicio > budget_sec:
             timeout = True
             break
-        token_alvo = token_alvo_info['address']
-
-        dexs_v2 = [dex for dex in dex_contracts if "V2" in dex]
-        dexs_compra = dexs_v2 + ["UniswapV3"]
-        dexs_venda = dexs_v2 + ["UniswapV3"]
-        for dex_compra_nome in dexs_compra:
+        for dex_venda_nome in dexs_venda:
+            if dex_compra_nome == dex_venda_nome:
+                continue
             if time.time() - inicio > budget_sec:
                 timeout = True
                 break
-            for dex_venda_nome in dexs_venda:
-                if dex_compra_nome == dex_venda_nome:
+
+            try:
+                # Reservas V2 (para calcular quantidade ótima); V3 usa placeholder
+                reservas_compra = reservas_v2[dex_compra_nome] if "V2" in dex_compra_nome else (1, 1)
+                reservas_venda = reservas_v2[dex_venda_nome] if "V2" in dex_venda_nome else (1, 1)
+
+                if not reservas_compra or not reservas_venda:
                     continue
-                if time.time() - inicio > budget_sec:
-                    timeout = True
-                    break
 
-                try:
-                    # Reservas V2 (para calcular quantidade ótima); V3 usa placeholder
-                    reservas_compra = obter_reservas_pool_v2(dex_compra_nome, token_emprestimo, token_alvo) if "V2" in dex_compra_nome else (1, 1)
-                    reservas_venda = obter_reservas_pool_v2(dex_venda_nome, token_emprestimo, token_alvo) if "V2" in dex_venda_nome else (1, 1)
-
-                    if not reservas_compra or not reservas_venda:
-                        continue
-
-                    quantidade_otima_base = 0
-                    if "V2" in dex_compra_nome and "V2" in dex_venda_nome:
-                        quantidade_otima_base = calcular_quantidade_otima(
-                            reservas_compra[0], reservas_compra[1], reservas_venda[1], reservas_venda[0]
-                        )
+                quantidade_otima_base = 0
+                if "V2" in dex_compra_nome and "V2" in dex_venda_nome:
+                    quantidade_otima_base = calcular_quantidade_otima(
+                        reservas_compra[0], reservas_compra[1], reservas_venda[1], reservas_venda[0]
+                    )
+                else:
+                    # Grid-search para combinações com V3
+                    token_decimals = config['TOKENS']['usdc']['decimals'] if token_emprestimo.lower() == config['TOKENS']['usdc']['address'].lower() else 6
+                    base_unit = 10 ** token_decimals
+                    base_candidates = [100, 200, 350, 500, 750, 1000, 1500, 2000, 3000, 5000, 8000, 12000]
+                    candidates_q = [int(x * base_unit) for x in base_candidates]
+                    melhor_q = 0
+                    melhor_lucro = Decimal(0)
+                    if time.time() - inicio > budget_sec:
+                        timeout = True
                     else:
-                        # Grid-search para combinações com V3
-                        token_decimals = config['TOKENS']['usdc']['decimals'] if token_emprestimo.lower() == config['TOKENS']['usdc']['address'].lower() else 6
-                        base_unit = 10 ** token_decimals
-                        base_candidates = [100, 200, 350, 500, 750, 1000, 1500, 2000, 3000, 5000, 8000, 12000]
-                        candidates_q = [int(x * base_unit) for x in base_candidates]
-                        melhor_q = 0
-                        melhor_lucro = Decimal(0)
-                        last_best_idx = -1
-                        for idx, q in enumerate(candidates_q):
-                            if time.time() - inicio > budget_sec:
-                                timeout = True
-                                break
-                            # Leg 1
-                            if "V2" in dex_compra_nome:
-                                out1, _ = obter_melhor_caminho_v2_e_quote(dex_compra_nome, token_emprestimo, token_alvo, q)
-                            else:
-                                out1, _ = obter_preco_saida_e_fee(dex_compra_nome, token_emprestimo, token_alvo, q)
-                            if out1 <= 0:
-                                continue
-                            # Leg 2
-                            if "V2" in dex_venda_nome:
-                                out2, _ = obter_melhor_caminho_v2_e_quote(dex_venda_nome, token_alvo, token_emprestimo, out1)
-                            else:
-                                out2, _ = obter_preco_saida_e_fee(dex_venda_nome, token_alvo, token_emprestimo, out1)
-                            if out2 <= 0:
-                                continue
-                            lucro_bruto_base = out2 - q
-                            if lucro_bruto_base <= 0:
-                                continue
-                            lucro_liquido_tmp = calcular_lucro_liquido_esperado(lucro_bruto_base, q, token_emprestimo)
+                        for q, lucro_liquido_tmp in _lucros_da_grade(dex_compra_nome, dex_venda_nome, token_emprestimo, token_alvo, candidates_q):
                             if lucro_liquido_tmp > melhor_lucro:
                                 melhor_lucro = lucro_liquido_tmp
                                 melhor_q = q
-                                last_best_idx = idx
-                        # Explorar quantias maiores se topo tocado
-                        if not timeout and last_best_idx == len(candidates_q) - 1:
-                            for q in [int(x * base_unit) for x in [20000, 30000, 50000]]:
-                                if time.time() - inicio > budget_sec:
-                                    timeout = True
-                                    break
-                                if q <= melhor_q:
-                                    continue
-                                if "V2" in dex_compra_nome:
-                                    out1, _ = obter_melhor_caminho_v2_e_quote(dex_compra_nome, token_emprestimo, token_alvo, q)
-                                else:
-                                    out1, _ = obter_preco_saida_e_fee(dex_compra_nome, token_emprestimo, token_alvo, q)
-                                if out1 <= 0:
-                                    continue
-                                if "V2" in dex_venda_nome:
-                                    out2, _ = obter_melhor_caminho_v2_e_quote(dex_venda_nome, token_alvo, token_emprestimo, out1)
-                                else:
-                                    out2, _ = obter_preco_saida_e_fee(dex_venda_nome, token_alvo, token_emprestimo, out1)
-                                if out2 <= 0:
-                                    continue
-                                lucro_bruto_base = out2 - q
-                                if lucro_bruto_base <= 0:
-                                    continue
-                                lucro_liquido_tmp = calcular_lucro_liquido_esperado(lucro_bruto_base, q, token_emprestimo)
+                    # Explorar quantias maiores se topo tocado
+                    if not timeout and melhor_q == candidates_q[-1]:
+                        if time.time() - inicio > budget_sec:
+                            timeout = True
+                        else:
+                            maiores = [q for q in (int(x * base_unit) for x in [20000, 30000, 50000]) if q > melhor_q]
+                            for q, lucro_liquido_tmp in _lucros_da_grade(dex_compra_nome, dex_venda_nome, token_emprestimo, token_alvo, maiores):
                                 if lucro_liquido_tmp > melhor_lucro:
                                     melhor_lucro = lucro_liquido_tmp
                                     melhor_q = q
-                        quantidade_otima_base = melhor_q
+                    quantidade_otima_base = melhor_q
+
+                if quantidade_otima_base == 0:
+                    logger.debug("Quantidade ótima/estimada resultou em 0. Sem oportunidade para este par/DEX combo.")
+                    continue
 
-                    if quantidade_otima_base == 0:
-                        logger.debug("Quantidade ótima/estimada resultou em 0. Sem oportunidade para este par/DEX combo.")
-                        continue
+                # Quote final com rotas reais/fees para diagnóstico e seleção
+                path1_eval = None
+                path2_eval = None
+                if "V2" in dex_compra_nome:
+                    amount_out_swap1, path1_eval = obter_melhor_caminho_v2_e_quote(dex_compra_nome, token_emprestimo, token_alvo, quantidade_otima_base)
+                    fee_compra_eval = 0
+                    path1_len = len(path1_eval) if path1_eval else 0
+                else:
+                    # Comparar single-hop vs multi-hop (diagnóstico)
+                    # Single-hop e multi-hop são independentes: o multi-hop corre em paralelo
+                    futuro_mh = None
+                    if config.get('enable_v3_multihop_scan', True):
+                        futuro_mh = _QUOTE_POOL.submit(quote_v3_multihop, token_emprestimo, token_alvo, quantidade_otima_base)
+                    single_out, single_fee = obter_preco_saida_e_fee(dex_compra_nome, token_emprestimo, token_alvo, quantidade_otima_base)
+                    mh_out, mh_tokens, mh_fees = futuro_mh.result() if futuro_mh else (0, [], [])
+                    if mh_out > single_out:
+                        amount_out_swap1 = mh_out
+                        fee_compra_eval = mh_fees[0] if mh_fees else single_fee
+                        path1_len = len(mh_tokens)
+                        if LOG_V2_PATHS and mh_tokens:
+                            logger.info("V3_MULTI-HOP COMPRA: %s", " -> ".join(_addr_to_sym(x) for x in mh_tokens)+f" | fees={mh_fees}")
+                    else:
+                        amount_out_swap1 = single_out
+                        fee_compra_eval = single_fee
+                        path1_len = 0
+                if "V2" in dex_venda_nome:
+                    amount_out_swap2, path2_eval = obter_melhor_caminho_v2_e_quote(dex_venda_nome, token_alvo, token_emprestimo, amount_out_swap1)
+                    fee_venda_eval = 0
+                    path2_len = len(path2_eval) if path2_eval else 0
+                else:
+                    futuro_mh2 = None
+                    if config.get('enable_v3_multihop_scan', True):
+                        futuro_mh2 = _QUOTE_POOL.submit(quote_v3_multihop, token_alvo, token_emprestimo, amount_out_swap1)
+                    single_out2, single_fee2 = obter_preco_saida_e_fee(dex_venda_nome, token_alvo, token_emprestimo, amount_out_swap1)
+                    mh_out2, mh_tokens2, mh_fees2 = futuro_mh2.result() if futuro_mh2 else (0, [], [])
+                    if mh_out2 > single_out2:
+                        amount_out_swap2 = mh_out2
+                        fee_venda_eval = mh_fees2[-1] if mh_fees2 else single_fee2
+                        path2_len = len(mh_tokens2)
+                        if LOG_V2_PATHS and mh_tokens2:
+                            logger.info("V3_MULTI-HOP VENDA: %s", " -> ".join(_addr_to_sym(x) for x in mh_tokens2)+f" | fees={mh_fees2}")
+                    else:
+                        amount_out_swap2 = single_out2
+                        fee_venda_eval = single_fee2
+                        path2_len = 0
 
-                    # Quote final com rotas reais/fees para diagnóstico e seleção
-                    path1_eval = None
-                    path2_eval = None
+                lucro_bruto_base = amount_out_swap2 - quantidade_otima_base
+                # Estimar unidades de gás baseadas em hops V2/V3 (aproximação leve)
+                try:
+                    hops_v2 = 0
+                    hops_v3 = 0
                     if "V2" in dex_compra_nome:
-                        amount_out_swap1, path1_eval = obter_melhor_caminho_v2_e_quote(dex_compra_nome, token_emprestimo, token_alvo, quantidade_otima_base)
-                        fee_compra_eval = 0
-                        path1_len = len(path1_eval) if path1_eval else 0
+                        hops_v2 += max(1, (path1_len - 1)) if path1_len else 1
                     else:
-                        # Comparar single-hop vs multi-hop (diagnóstico)
-                        single_out, single_fee = obter_preco_saida_e_fee(dex_compra_nome, token_emprestimo, token_alvo, quantidade_otima_base)
-                        mh_out, mh_tokens, mh_fees = (0, [], [])
-                        if config.get('enable_v3_multihop_scan', True):
-                            mh_out, mh_tokens, mh_fees = quote_v3_multihop(token_emprestimo, token_alvo, quantidade_otima_base)
-                        if mh_out > single_out:
-                            amount_out_swap1 = mh_out
-                            fee_compra_eval = mh_fees[0] if mh_fees else single_fee
-                            path1_len = len(mh_tokens)
-                            if LOG_V2_PATHS and mh_tokens:
-                                logger.info("V3_MULTI-HOP COMPRA: %s", " -> ".join(_addr_to_sym(x) for x in mh_tokens)+f" | fees={mh_fees}")
-                        else:
-                            amount_out_swap1 = single_out
-                            fee_compra_eval = single_fee
-                            path1_len = 0
+                        hops_v3 += max(1, (path1_len - 1)) if path1_len else 1
                     if "V2" in dex_venda_nome:
-                        amount_out_swap2, path2_eval = obter_melhor_caminho_v2_e_quote(dex_venda_nome, token_alvo, token_emprestimo, amount_out_swap1)
-                        fee_venda_eval = 0
-                        path2_len = len(path2_eval) if path2_eval else 0
+                        hops_v2 += max(1, (path2_len - 1)) if path2_len else 1
                     else:
-                        single_out2, single_fee2 = obter_preco_saida_e_fee(dex_venda_nome, token_alvo, token_emprestimo, amount_out_swap1)
-                        mh_out2, mh_tokens2, mh_fees2 = (0, [], [])
-                        if config.get('enable_v3_multihop_scan', True):
-                            mh_out2, mh_tokens2, mh_fees2 = quote_v3_multihop(token_alvo, token_emprestimo, amount_out_swap1)
-                        if mh_out2 > single_out2:
-                            amount_out_swap2 = mh_out2
-                            fee_venda_eval = mh_fees2[-1] if mh_fees2 else single_fee2
-                            path2_len = len(mh_tokens2)
-                            if LOG_V2_PATHS and mh_tokens2:
-                                logger.info("V3_MULTI-HOP VENDA: %s", " -> ".join(_addr_to_sym(x) for x in mh_tokens2)+f" | fees={mh_fees2}")
-                        else:
-                            amount_out_swap2 = single_out2
-                            fee_venda_eval = single_fee2
-                            path2_len = 0
+                        hops_v3 += max(1, (path2_len - 1)) if path2_len else 1
+                    # Custos médios aproximados por hop (Polygon): V2~115k, V3~130k
+                    gas_units = 50_000  # overhead base
+                    gas_units += hops_v2 * 115_000
+                    gas_units += hops_v3 * 130_000
+                    # Clamp a um teto razoável para evitar extremos
+                    gas_units = min(gas_units, GAS_LIMIT)
+                except Exception:
+                    gas_units = None
+                lucro_liquido = calcular_lucro_liquido_esperado(lucro_bruto_base, quantidade_otima_base, token_emprestimo, override_gas_units=gas_units)
 
-                    lucro_bruto_base = amount_out_swap2 - quantidade_otima_base
-                    # Estimar unidades de gás baseadas em hops V2/V3 (aproximação leve)
-                    try:
-                        hops_v2 = 0
-                        hops_v3 = 0
-                        if "V2" in dex_compra_nome:
-                            hops_v2 += max(1, (path1_len - 1)) if path1_len else 1
-                        else:
-                            hops_v3 += max(1, (path1_len - 1)) if path1_len else 1
-                        if "V2" in dex_venda_nome:
-                            hops_v2 += max(1, (path2_len - 1)) if path2_len else 1
-                        else:
-                            hops_v3 += max(1, (path2_len - 1)) if path2_len else 1
-                        # Custos médios aproximados por hop (Polygon): V2~115k, V3~130k
-                        gas_units = 50_000  # overhead base
-                        gas_units += hops_v2 * 115_000
-                        gas_units += hops_v3 * 130_000
-                        # Clamp a um teto razoável para evitar extremos
-                        gas_units = min(gas_units, int(config.get('gas_limit', 3_000_000)))
-                    except Exception:
-                        gas_units = None
-                    lucro_liquido = calcular_lucro_liquido_esperado(lucro_bruto_base, quantidade_otima_base, token_emprestimo, override_gas_units=gas_units)
-
-                    # Guardar candidato para TOP3
-                    try:
-                        candidatos.append({
-                            "lucro_liquido": lucro_liquido,
-                            "lucro_bruto_base": int(lucro_bruto_base),
-                            "dex_compra_nome": dex_compra_nome,
-                            "dex_venda_nome": dex_venda_nome,
-                            "fee_compra": int(fee_compra_eval),
-                            "fee_venda": int(fee_venda_eval),
-                            "path1_len": int(path1_len),
-                            "path2_len": int(path2_len),
-                            "path1": path1_eval if LOG_V2_PATHS else None,
-                            "path2": path2_eval if LOG_V2_PATHS else None,
-                            "quantidade_base": int(quantidade_otima_base),
-                            "token_alvo": token_alvo,
-                        })
-                    except Exception:
-                        pass
-
-                    # Seleção se lucro acima do threshold (aplica TRIANGULAR_ONLY se ativo)
-                    is_tri_candidate = (path1_len >= 3) or (path2_len >= 3)
-                    if TRIANGULAR_ONLY and not is_tri_candidate:
-                        continue
-                    if lucro_liquido > melhor_lucro_liquido and lucro_liquido >= MIN_PROFIT_USDC:
-                        melhor_lucro_liquido = lucro_liquido
-                        melhor_oportunidade = {
-                            "token_alvo": token_alvo,
-                            "dex_compra": dex_contracts[dex_compra_nome]['router'].address,
-                            "dex_venda": dex_contracts[dex_venda_nome]['router'].address,
-                            "dex_compra_nome": dex_compra_nome,
-                            "dex_venda_nome": dex_venda_nome,
-                            "quantidade_emprestimo_base": quantidade_otima_base,
-                            "quantidade_emprestimo": config['from_base'](web3, quantidade_otima_base, token_emprestimo),
-                            "lucro_liquido_estimado": lucro_liquido
-                        }
-                        tag = " [TRI]" if TRIANGULAR_MODE and is_tri_candidate else ""
-                        logger.info(f"Nova oportunidade encontrada{tag}! Lucro líquido estimado: {lucro_liquido:.4f} USDC.")
-
-                except Exception as e:
-                    logger.debug(f"Erro ao analisar oportunidade ({dex_compra_nome}->{dex_venda_nome}): {e}", exc_info=True)
+                # Guardar candidato para TOP3
+                try:
+                    candidatos.append({
+                        "lucro_liquido": lucro_liquido,
+                        "lucro_bruto_base": int(lucro_bruto_base),
+                        "dex_compra_nome": dex_compra_nome,
+                        "dex_venda_nome": dex_venda_nome,
+                        "fee_compra": int(fee_compra_eval),
+                        "fee_venda": int(fee_venda_eval),
+                        "path1_len": int(path1_len),
+                        "path2_len": int(path2_len),
+                        "path1": path1_eval if LOG_V2_PATHS else None,
+                        "path2": path2_eval if LOG_V2_PATHS else None,
+                        "quantidade_base": int(quantidade_otima_base),
+                        "token_alvo": token_alvo,
+                    })
+                except Exception:
+                    pass
+
+                # Seleção se lucro acima do threshold (aplica TRIANGULAR_ONLY se ativo)
+                is_tri_candidate = (path1_len >= 3) or (path2_len >= 3)
+                if TRIANGULAR_ONLY and not is_tri_candidate:
                     continue
-            if timeout:
-                break
+                if lucro_liquido > melhor_lucro_liquido and lucro_liquido >= MIN_PROFIT_USDC:
+                    melhor_lucro_liquido = lucro_liquido
+                    melhor_oportunidade = {
+                        "token_alvo": token_alvo,
+                        "dex_compra": dex_contracts[dex_compra_nome]['router'].address,
+                        "dex_venda": dex_contracts[dex_venda_nome]['router'].address,
+                        "dex_compra_nome": dex_compra_nome,
+                        "dex_venda_nome": dex_venda_nome,
+                        "quantidade_emprestimo_base": quantidade_otima_base,
+                        "quantidade_emprestimo": from_base(web3, quantidade_otima_base, token_emprestimo),
+                        "lucro_liquido_estimado": lucro_liquido
+                    }
+                    tag = " [TRI]" if TRIANGULAR_MODE and is_tri_candidate else ""
+                    logger.info(f"Nova oportunidade encontrada{tag}! Lucro líquido estimado: {lucro_liquido:.4f} USDC.")
+
+            except Exception as e:
+                logger.debug("Erro ao analisar oportunidade (%s->%s): %s", dex_compra_nome, dex_venda_nome, e, exc_info=True)
+                continue
         if timeout:
             break
 
+    return candidatos, melhor_oportunidade, melhor_lucro_liquido, timeout
+
+
+def identificar_melhor_oportunidade(token_emprestimo: str):
+    """
+    Identifica a melhor oportunidade de arbitragem, calculando a quantidade ótima
+    e o lucro líquido esperado para cada par.
+    """
+    melhor_oportunidade = None
+    melhor_lucro_liquido = Decimal(0)
+    candidatos = []  # coleta para TOP3
+
+    # Orçamento de tempo por varredura
+    try:
+        # Padrão mais generoso para suportar V3 multi-hop; permite override por ENV
+        default_budget = int(config.get('scan_time_budget_seconds', 120))
+        budget_sec = int(os.getenv('SCAN_TIME_BUDGET_SECONDS', str(default_budget)))
+    except Exception:
+        budget_sec = int(config.get('scan_time_budget_seconds', 120))
+    inicio = time.time()
+    timeout = False
+
+    # Uma tarefa por token alvo; as chamadas RPC de cada tarefa correm em paralelo
+    futuros = [
+        _SCAN_POOL.submit(_avaliar_token_alvo, token_emprestimo, info['address'], inicio, budget_sec)
+        for info in ACTIVE_TOKENS
+        if info['address'] != token_emprestimo
+    ]
+    for futuro in as_completed(futuros):
+        try:
+            cands_token, oport_token, lucro_token, timeout_token = futuro.result()
+        except Exception as e:
+            logger.debug("Erro ao avaliar token alvo: %s", e, exc_info=True)
+            continue
+        candidatos.extend(cands_token)
+        timeout = timeout or timeout_token
+        if oport_token and lucro_token > melhor_lucro_liquido:
+            melhor_lucro_liquido = lucro_token
+            melhor_oportunidade = oport_token
+
     # Logging de TOPK do ciclo, com marcação de triangulares
     if candidatos:
         try:
@@ -399,6 +438,43 @@ def identificar_melhor_oportunidade(token_emprestimo: str):
     return melhor_oportunidade
 
 
+def _contrato_emite_arbitrage_completed() -> bool:
+    """True se a ABI do contrato de flash loan ativo declara o evento ArbitrageCompleted."""
+    return any(
+        item.get('type') == 'event' and item.get('name') == 'ArbitrageCompleted'
+        for item in config['flashloan_contract'].abi
+    )
+
+
+def _saldo_ou_none(token_address: str) -> int | None:
+    """Saldo ERC20 da carteira (unidade base), ou None se a leitura falhar (nunca 0 por erro)."""
+    try:
+        return config['erc20'](web3, token_address).functions.balanceOf(wallet_address).call()
+    except Exception as e:
+        logger.warning("Não foi possível ler o saldo de %s: %s", token_address[-6:], e)
+        return None
+
+
+def _lucro_realizado_base(receipt, saldo_inicial_base: int | None, token_emprestimo: str) -> int | None:
+    """
+    Lucro efetivamente realizado (unidade base do token emprestado).
+    Lê o evento ArbitrageCompleted do recibo (sem RPC extra); se o contrato ativo
+    não o expõe na ABI, usa a diferença de saldo face ao snapshot pré-operação.
+    """
+    try:
+        eventos = config['flashloan_contract'].events.ArbitrageCompleted().process_receipt(receipt, errors=DISCARD)
+        if eventos:
+            return int(eventos[-1]['args']['lucro'])
+    except Exception:
+        pass
+    if saldo_inicial_base is None:
+        return None
+    saldo_final_base = _saldo_ou_none(token_emprestimo)
+    if saldo_final_base is None:
+        return None
+    return saldo_final_base - saldo_inicial_base
+
+
 def executar_arbitragem_com_flashloan(oportunidade: dict):
     """
     Executa a operação de arbitragem com a quantidade de empréstimo otimizada.
@@ -415,7 +491,7 @@ def executar_arbitragem_com_flashloan(oportunidade: dict):
 
         quantidade_emp_base = oportunidade.get('quantidade_emprestimo_base')
         if not quantidade_emp_base:
-            quantidade_emp_base = config['to_base'](web3, float(quantidade_emprestimo), token_emprestimo)
+            quantidade_emp_base = to_base(web3, float(quantidade_emprestimo), token_emprestimo)
 
         dex_compra_nome = oportunidade.get('dex_compra_nome', 'QuickSwapV2')
         dex_venda_nome = oportunidade.get('dex_venda_nome', 'QuickSwapV2')
@@ -441,11 +517,11 @@ def executar_arbitragem_com_flashloan(oportunidade: dict):
                     quote1 = mh1
                     fee_compra = 0
                 except Exception as ex:
-                    logger.debug(f"Falha ao codificar path V3 multi-hop (compra). Usando single-hop. Erro: {ex}")
+                    logger.debug("Falha ao codificar path V3 multi-hop (compra). Usando single-hop. Erro: %s", ex)
         else:
             quote1, path_compra_v2 = obter_melhor_caminho_v2_e_quote(dex_compra_nome, token_emprestimo, oportunidade['token_alvo'], quantidade_emp_base)
             fee_compra = 0
-        amountOutMin1 = int(quote1 * (10_000 - slippage_bps) / 10_000) if quote1 and quote1 > 0 else 0
+        amountOutMin1 = quote1 * (BPS_SCALE - slippage_bps) // BPS_SCALE if quote1 and quote1 > 0 else 0
 
         # amountOutMin2: tokenAlvo -> tokenEmprestado na DEX de venda
         if dex_venda_nome == 'UniswapV3':
@@ -460,16 +536,18 @@ def executar_arbitragem_com_flashloan(oportunidade: dict):
                     quote2 = mh2
                     fee_venda = 0
                 except Exception as ex:
-                    logger.debug(f"Falha ao codificar path V3 multi-hop (venda). Usando single-hop. Erro: {ex}")
+                    logger.debug("Falha ao codificar path V3 multi-hop (venda). Usando single-hop. Erro: %s", ex)
         else:
             quote2, path_venda_v2 = obter_melhor_caminho_v2_e_quote(dex_venda_nome, oportunidade['token_alvo'], token_emprestimo, quote1 if quote1 else 0)
             fee_venda = 0
-        amountOutMin2 = int(quote2 * (10_000 - slippage_bps) / 10_000) if quote2 and quote2 > 0 else 0
+        amountOutMin2 = quote2 * (BPS_SCALE - slippage_bps) // BPS_SCALE if quote2 and quote2 > 0 else 0
 
         if amountOutMin1 == 0 or amountOutMin2 == 0:
             logger.warning("Quotes inválidos ou liquidez insuficiente para calcular slippage. Operação abortada.")
             return
 
+        # Ambas as pernas (compra e venda) seguem nos params e são executadas em
+        # executeOperation: uma única transação atómica, sem swaps avulsos.
         if use_v2_contract:
             params_codificados = encode(
                 ['address','address','address','uint256','uint256','uint256','uint24','uint24','address[]','address[]','bytes','bytes'],
@@ -510,6 +588,10 @@ def executar_arbitragem_com_flashloan(oportunidade: dict):
                     logger.info("DRY_RUN V3_PATH2 bytes len: %d", len(path_venda_v3_bytes))
             return
 
+        # Snapshot do saldo (RPC bloqueante antes do envio) só quando o contrato não emite
+        # ArbitrageCompleted; uma leitura falhada fica None e o lucro realizado não é reportado
+        saldo_inicial = None if _contrato_emite_arbitrage_completed() else _saldo_ou_none(token_emprestimo)
+
         receipt = iniciar_operacao_flash_loan(
             token_a_emprestar=token_emprestimo,
             quantidade_a_emprestar=float(quantidade_emprestimo),
@@ -518,6 +600,13 @@ def executar_arbitragem_com_flashloan(oportunidade: dict):
 
         if receipt and receipt['status'] == 1:
             logger.info("Transação de arbitragem executada com sucesso!")
+            lucro_realizado_base = _lucro_realizado_base(receipt, saldo_inicial, token_emprestimo)
+            if lucro_realizado_base is not None:
+                lucro_realizado = config['from_base'](web3, lucro_realizado_base, token_emprestimo)
+                logger.info(
+                    "Lucro realizado: %.4f USDC (estimado: %.4f USDC).",
+                    float(lucro_realizado), float(oportunidade.get('lucro_liquido_estimado', 0))
+                )
         else:
             logger.error("A transação de arbitragem falhou (revertida pelo contrato).")
 
@@ -531,14 +620,16 @@ def iniciar_bot_arbitragem(stop_event):
     TOKEN_EMPRESTIMO = TOKENS['usdc']['address']
 
     logger.info("Bot de Arbitragem ZEUS v2.0 (Otimizado) iniciado.")
+    # Com WS_URL, os novos blocos chegam por subscrição e o health-check deixa de fazer polling
+    iniciar_monitor_new_heads()
 
     while not stop_event.is_set():
         try:
             ciclo_inicio = time.time()
             # Monitor RPC: alerta se bloco não avança por >120s
             try:
-                bn = int(web3.eth.block_number)
-                now = time.time()
+                bn = cached_block_number()
+                now = time.monotonic()
                 # Telemetria de latência aproximada por diferença de tempo entre blocos
                 global _last_block_time, _ema_block_time
                 if _last_block_time is not None:
@@ -573,10 +664,6 @@ def iniciar_bot_arbitragem(stop_event):
             except Exception as e:
                 logger.debug("Falha ao ler número do bloco para health-check: %s", e)
 
-            if not verificar_saldo_matic_suficiente(web3, wallet_address, min_balance_matic):
-                time.sleep(300)
-                continue
-
             # Checagem de estáveis mínimos (opcional; configurável por .env)
             try:
                 from decimal import Decimal as _D
@@ -587,9 +674,18 @@ def iniciar_bot_arbitragem(stop_event):
             except Exception:
                 min_usdc = Decimal("0")
                 min_usdt = Decimal("0")
-            if (min_usdc > 0 or min_usdt > 0) and not verificar_saldo_stables_minimo(web3, wallet_address, min_usdc=min_usdc, min_usdt=min_usdt):
+            # MATIC e estáveis lidos numa só RPC, no mesmo bloco
+            estado_carteira = verificar_carteira_pronta(
+                web3, wallet_address, min_balance_matic, min_usdc=min_usdc, min_usdt=min_usdt
+            )
+            if not estado_carteira.matic_ok:
+                if stop_event.wait(300):
+                    break
+                continue
+            if not (estado_carteira.usdc_ok and estado_carteira.usdt_ok):
                 logger.info("Aguardando 5 minutos antes de tentar novamente devido a saldos estáveis insuficientes.")
-                time.sleep(300)
+                if stop_event.wait(300):
+                    break
                 continue
 
             # Anti-saturação: se orçamento muito apertado no último ciclo, fazer um ciclo de varredura parcial
@@ -669,6 +765,8 @@ def iniciar_bot_arbitragem(stop_event):
         log_metrics_if_due(logger)
 
         logger.info(f"Aguardando {intervalo_segundos} segundos para a próxima verificação.")
-        time.sleep(intervalo_segundos)
+        # wait() retorna imediatamente quando 'stop' é sinalizado
+        if stop_event.wait(intervalo_segundos):
+            break
 
     logger.info("Bot de arbitragem parado.")
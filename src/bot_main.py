@@ -64,7 +64,7 @@ def main():
 
             if auto_duration > 0:
                 logger.info(f"Execução automática por {auto_duration}s. Depois irá parar e sair.")
-                time.sleep(auto_duration)
+                stop_event.wait(auto_duration)
                 stop_event.set()
                 bot_thread.join(timeout=10)
                 logger.info("Encerrando após modo autostart temporizado.")
@@ -1,14 +1,19 @@
 import os
 import sys
+import time
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
 from web3 import Web3
+from web3.exceptions import TimeExhausted, TransactionNotFound
 from web3.types import TxReceipt, TxParams
 from hexbytes import HexBytes
+from eth_abi.abi import encode
 
 # --- Configuração de Caminhos e Importações ---
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(base_dir)
 
-from utils.config import config
+from utils.config import config, obter_checksum
 from utils.gas_utils import obter_taxa_gas
 
 # --- Variáveis Globais do Módulo ---
@@ -17,42 +22,145 @@ logger = config['logger']
 private_key = config['private_key']
 nonce_manager = config['nonce_manager']
 flashloan_contract = config['flashloan_contract']
+# Valores imutáveis após o arranque (o hot-switch de RPC não os altera)
+wallet_address = config['wallet_address']
+gas_limit_max = int(config['gas_limit'])
+to_base = config['to_base']
+receipt_poll_latency = float(config.get('receipt_poll_latency', 2.0))
+receipt_poll_max_latency = float(config.get('receipt_poll_max_latency', 8.0))
+# O chain id é imutável: obtido na sonda de conexão do config, sem eth_chainId por transação
+_chain_id_cached = config['chain_id']
+_tempo_bloco_seg: float | None = None
+# gwei -> wei é apenas x10^9: multiplicação inteira em vez de Web3.to_wei por transação
+WEI_POR_GWEI = 1_000_000_000
+# Priority fee EIP-1559 (~1.5 gwei, ajustável via env), convertida para wei uma única vez
+_priority_fee_wei = int(Decimal(os.getenv('PRIORITY_FEE_GWEI', '1.5')) * WEI_POR_GWEI)
+# Métodos do caminho de envio resolvidos uma vez (evita o proxy de módulos do web3 por chamada).
+# A conta local é construída uma vez: a assinatura reutiliza o objeto da chave privada.
+_conta_local = web3.eth.account.from_key(private_key)
+_sign_transaction = _conta_local.sign_transaction
+_send_raw_transaction = web3.eth.send_raw_transaction
+_get_transaction_receipt = web3.eth.get_transaction_receipt
+# Calldata de initiateFlashLoan codificada diretamente (assinatura idêntica em V1 e V2)
+_SELETOR_INITIATE = bytes(Web3.keccak(text="initiateFlashLoan(address,uint256,bytes)")[:4])
+_TIPOS_INITIATE = ['address', 'uint256', 'bytes']
+_flashloan_address = flashloan_contract.address
+# Campos fixos de toda transação de flash loan; por chamada só variam data/gas/nonce/taxas
+_TX_TEMPLATE: TxParams = {
+    'from': wallet_address,
+    'to': _flashloan_address,
+    'value': 0,
+    'chainId': _chain_id_cached,
+}
+# Pool reutilizável para as leituras RPC independentes que antecedem o envio
+_rpc_pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="flashloan-rpc")
 
 # --- Funções de Transação ---
 
+def _hash_se_ja_enviada(signed_tx, erro: Exception) -> HexBytes | None:
+    """
+    Após um envio falhado (ex.: timeout de leitura e nova tentativa), "already known" ou
+    "nonce too low" podem significar que esta mesma tx assinada já está no mempool ou minerada.
+    Devolve o hash original nesse caso, para se aguardar o recibo em vez de reassinar.
+    """
+    mensagem = str(erro).lower()
+    if 'already known' in mensagem:
+        return HexBytes(signed_tx.hash)
+    if 'nonce too low' in mensagem:
+        try:
+            web3.eth.get_transaction(signed_tx.hash)
+            return HexBytes(signed_tx.hash)
+        except TransactionNotFound:
+            return None
+    return None
+
 def enviar_transacao_assinada(tx: TxParams) -> HexBytes:
     """Assina e envia uma transação, retornando o hash."""
+    signed_tx = None
     try:
         logger.info("Enviando transação para a rede...")
-        signed_tx = web3.eth.account.sign_transaction(tx, private_key)
-        tx_hash = web3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        logger.info(f"Transação enviada com sucesso. Hash: {tx_hash.hex()}")
+        signed_tx = _sign_transaction(tx)
+        tx_hash = _send_raw_transaction(signed_tx.rawTransaction)
+        logger.info("Transação enviada com sucesso. Hash: %s", tx_hash.hex())
         return tx_hash
     except Exception as e:
+        tx_hash = _hash_se_ja_enviada(signed_tx, e) if signed_tx is not None else None
+        if tx_hash is not None:
+            logger.warning("A transação já tinha chegado à rede (%s). Hash: %s", e, tx_hash.hex())
+            return tx_hash
         # CORREÇÃO: O log de erro agora mostra a exceção principal, que é mais informativa
         # e evita o AttributeError.
-        logger.error(
-            f"Erro ao enviar transação. Nonce: {tx.get('nonce')}. "
-            f"Causa: {e}"
-        )
+        logger.error("Erro ao enviar transação. Nonce: %s. Causa: %s", tx.get('nonce'), e)
         raise
 
+def _estimar_tempo_bloco() -> float:
+    """Tempo médio de bloco (s), medido uma única vez sobre os últimos 10 blocos."""
+    global _tempo_bloco_seg
+    if _tempo_bloco_seg is None:
+        try:
+            ultimo = web3.eth.get_block('latest')
+            anterior = web3.eth.get_block(ultimo['number'] - 10)
+            _tempo_bloco_seg = max(0.5, (ultimo['timestamp'] - anterior['timestamp']) / 10)
+        except Exception:
+            _tempo_bloco_seg = 2.0  # média da Polygon PoS
+    return _tempo_bloco_seg
+
+def aguardar_recibo_adaptativo(tx_hash: HexBytes, timeout_segundos: int = 180) -> TxReceipt:
+    """
+    Consulta o recibo com backoff exponencial: começa em ~meio bloco (limitado por
+    RECEIPT_POLL_LATENCY) e cresce 1.5x por tentativa até RECEIPT_POLL_MAX_LATENCY.
+    Confirmações rápidas custam poucas RPCs e transações presas não saturam o nó.
+    """
+    base = min(receipt_poll_latency, _estimar_tempo_bloco() / 2)
+    inicio = time.monotonic()
+    tentativa = 0
+    while True:
+        decorrido = time.monotonic() - inicio
+        if decorrido >= timeout_segundos:
+            raise TimeExhausted(f"Transação {tx_hash.hex()} não confirmada após {timeout_segundos}s.")
+        time.sleep(min(receipt_poll_max_latency, base * 1.5 ** tentativa, timeout_segundos - decorrido))
+        tentativa += 1
+        try:
+            return _get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            continue
+
 def aguardar_recibo_transacao(tx_hash: HexBytes, timeout_segundos: int = 180) -> TxReceipt:
     """Aguarda o recibo da transação."""
     try:
-        logger.info(f"Aguardando recibo para a transação {tx_hash.hex()}...")
-        receipt = web3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout_segundos)
+        logger.info("Aguardando recibo para a transação %s...", tx_hash.hex())
+        receipt = aguardar_recibo_adaptativo(tx_hash, timeout_segundos)
         
         if receipt['status'] == 1:
-            logger.info(f"Transação {tx_hash.hex()} confirmada com sucesso no bloco {receipt['blockNumber']}.")
+            logger.info("Transação %s confirmada com sucesso no bloco %s.", tx_hash.hex(), receipt['blockNumber'])
         else:
-            logger.warning(f"Transação {tx_hash.hex()} falhou (revertida). Status: 0.")
+            logger.warning("Transação %s falhou (revertida). Status: 0.", tx_hash.hex())
         
         return receipt
     except Exception as e:
-        logger.error(f"Erro ao aguardar o recibo da transação {tx_hash.hex()}: {e}")
+        logger.error("Erro ao aguardar o recibo da transação %s: %s", tx_hash.hex(), e)
         raise
 
+def _codificar_initiate_flash_loan(token: str, quantidade_base: int, params: bytes) -> str:
+    """Calldata de initiateFlashLoan sem passar pela validação/cópia de contract.functions."""
+    return '0x' + (_SELETOR_INITIATE + encode(_TIPOS_INITIATE, [token, quantidade_base, params])).hex()
+
+def _estimar_gas_limit(dados: str) -> int:
+    """Gas limit dinâmico com bump de segurança (+15%) e cap pelo config."""
+    try:
+        gas_est = web3.eth.estimate_gas({'from': wallet_address, 'to': _flashloan_address, 'data': dados})
+        return min(int(gas_est * 1.15), gas_limit_max)
+    except Exception:
+        return gas_limit_max
+
+def _obter_base_fee_pendente() -> int | None:
+    """baseFeePerGas do bloco pendente, ou None se a rede não suportar EIP-1559."""
+    try:
+        pending_block = web3.eth.get_block('pending')
+        return pending_block.get('baseFeePerGas') if isinstance(pending_block, dict) else getattr(pending_block, 'baseFeePerGas', None)
+    except Exception:
+        return None
+
 # --- Função Principal do Flash Loan ---
 
 def iniciar_operacao_flash_loan(
@@ -65,71 +173,63 @@ def iniciar_operacao_flash_loan(
     """
     tx = None # Inicializa tx para o bloco except
     try:
-        quantidade_em_unidade_base = config['to_base'](web3, quantidade_a_emprestar, token_a_emprestar)
+        quantidade_em_unidade_base = to_base(web3, quantidade_a_emprestar, token_a_emprestar)
         
         logger.info(
-            f"Iniciando Flash Loan de {quantidade_a_emprestar} de {token_a_emprestar[-6:]} "
-            f"({quantidade_em_unidade_base} na unidade base)."
+            "Iniciando Flash Loan de %s de %s (%s na unidade base).",
+            quantidade_a_emprestar, token_a_emprestar[-6:], quantidade_em_unidade_base
         )
 
-        tx_func = flashloan_contract.functions.initiateFlashLoan(
-            Web3.to_checksum_address(token_a_emprestar),
+        dados = _codificar_initiate_flash_loan(
+            obter_checksum(token_a_emprestar),
             quantidade_em_unidade_base,
             params_codificados
         )
 
-        nonce = nonce_manager.get_nonce(refresh=True)
-        # Gas limit dinâmico com bump de segurança (ex.: +15%) e cap pelo config
-        try:
-            gas_est = tx_func.estimate_gas({'from': config['wallet_address']})
-            gas_est = int(gas_est * 1.15)
-            gas_limit = min(gas_est, int(config['gas_limit']))
-        except Exception:
-            gas_limit = int(config['gas_limit'])
+        # Estimativa de gás e base fee são RPCs independentes: disparar em paralelo.
+        # O nonce é reservado localmente (sem RPC); ressincroniza-se apenas em erro.
+        futuro_gas = _rpc_pool.submit(_estimar_gas_limit, dados)
+        futuro_base_fee = _rpc_pool.submit(_obter_base_fee_pendente)
+        nonce = nonce_manager.reserve_nonce()
+        gas_limit = futuro_gas.result()
+        base_fee = futuro_base_fee.result()
 
         # EIP-1559: preferir maxFeePerGas/maxPriorityFeePerGas quando disponível
-        try:
-            pending_block = web3.eth.get_block('pending')
-            base_fee = pending_block.get('baseFeePerGas') if isinstance(pending_block, dict) else getattr(pending_block, 'baseFeePerGas', None)
-        except Exception:
-            base_fee = None
         max_fee = None
         max_priority = None
         if base_fee is not None:
             # Estratégia simples: priority ~1.5 gwei (ajustável via env), maxFee = base*2 + priority
-            prio_gwei = float(os.getenv('PRIORITY_FEE_GWEI', '1.5'))
-            max_priority = Web3.to_wei(prio_gwei, 'gwei')
+            max_priority = _priority_fee_wei
             max_fee = base_fee * 2 + max_priority
         else:
-            # Fallback para gasPrice legado
+            # Fallback para gasPrice legado (obter_taxa_gas mantém cache de curta duração)
             gas_price_gwei = obter_taxa_gas(web3, logger)
 
-        common = {
-            'chainId': web3.eth.chain_id,
-            'gas': gas_limit,
-            'nonce': nonce,
-        }
+        # Transação montada sobre o template: gas, nonce e taxas já são conhecidos, pelo
+        # que build_transaction só acrescentaria validação e RPCs de preenchimento.
+        tx = {**_TX_TEMPLATE, 'data': dados, 'gas': gas_limit, 'nonce': nonce}
         if max_fee is not None and max_priority is not None:
-            tx = tx_func.build_transaction({
-                **common,
-                'maxFeePerGas': int(max_fee),
-                'maxPriorityFeePerGas': int(max_priority),
-                'type': 2,
-            })
+            tx['maxFeePerGas'] = int(max_fee)
+            tx['maxPriorityFeePerGas'] = int(max_priority)
+            tx['type'] = 2
         else:
-            tx = tx_func.build_transaction({
-                **common,
-                'gasPrice': Web3.to_wei(gas_price_gwei, 'gwei'),
-            })
+            tx['gasPrice'] = int(Decimal(str(gas_price_gwei)) * WEI_POR_GWEI)
 
-        tx_hash = enviar_transacao_assinada(tx)
+        try:
+            tx_hash = enviar_transacao_assinada(tx)
+        except ValueError as e:
+            if 'nonce' not in str(e).lower():
+                raise
+            # Nonce local divergiu da rede (ex.: tx enviada por outro processo): ressincronizar e repetir
+            nonce_manager.sync_with_network()
+            tx['nonce'] = nonce_manager.reserve_nonce()
+            tx_hash = enviar_transacao_assinada(tx)
         receipt = aguardar_recibo_transacao(tx_hash)
 
-        nonce_manager.incrementar_se_confirmado(receipt)
-
+        # O nonce já foi consumido na reserva (mesmo uma tx revertida o consome on-chain)
         return receipt
 
     except Exception as e:
-        logger.critical(f"Falha crítica ao executar o flash loan: {e}")
+        logger.critical("Falha crítica ao executar o flash loan: %s", e)
         nonce_manager.sync_with_network()
         return None # Retorna None em caso de falha
@@ -7,7 +7,8 @@ usados em contratos inteligentes na blockchain.
 
 Funções:
     carregar_abi(abi_filename: str) -> list:
-        Carrega um arquivo ABI a partir do diretório 'abis' e retorna seu conteúdo como uma lista.
+        Carrega um arquivo ABI a partir do diretório 'abis' e retorna seu conteúdo como uma lista
+        (aceita também artefactos Hardhat, com a lista em 'abi'). Cache único do processo.
         Parâmetros:
             abi_filename (str): O nome do arquivo ABI a ser carregado.
         Retorna:
@@ -15,45 +16,68 @@ Funções:
         Exceções:
             TypeError: Se o abi_filename não for uma string.
             FileNotFoundError: Se o arquivo ABI não for encontrado no caminho especificado.
-            ValueError: Se o conteúdo do arquivo ABI não for uma lista.
+            ValueError: Se o conteúdo do arquivo ABI não for uma lista nem um artefacto com 'abi'.
             json.JSONDecodeError: Se ocorrer um erro ao decodificar o arquivo ABI.
             Exception: Para outros erros inesperados durante o carregamento do arquivo ABI.
+
+    _json_loads(dados: bytes | str):
+        Parse JSON partilhado pelo projeto (orjson quando disponível, stdlib como fallback).
 """
 import json
 import logging
 import os
 
+# orjson (opcional) faz o parse 3-5x mais rápido; stdlib como fallback. Shim único do projeto,
+# importado por config (ABIs) e token_cache (cache de decimais)
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 logger = logging.getLogger("arbitrage_bot")
 
+# Cache por caminho absoluto: cada ficheiro ABI é lido e parseado uma única vez (único do processo;
+# config.carregar_abi_localmente delega aqui)
+_abi_cache = {}
+
 def carregar_abi(abi_filename):
     if not isinstance(abi_filename, str):
-        logger.error(f"Tipo inválido para abi_filename: {type(abi_filename)}. Esperado uma string.")
+        logger.error("Tipo inválido para abi_filename: %s. Esperado uma string.", type(abi_filename))
         raise TypeError(f"Esperado uma string para abi_filename, mas recebido {type(abi_filename)}.")
 
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     abi_path = os.path.join(base_dir, 'abis', abi_filename)
 
+    if abi_path in _abi_cache:
+        return _abi_cache[abi_path]
+
     if not os.path.exists(abi_path):
-        logger.error(f"Arquivo ABI não encontrado: {abi_path}")
+        logger.error("Arquivo ABI não encontrado: %s", abi_path)
         raise FileNotFoundError(f"Arquivo ABI não encontrado: {abi_path}")
 
-    logger.info(f"Tentando carregar o arquivo ABI de: {abi_path}")
+    logger.info("Tentando carregar o arquivo ABI de: %s", abi_path)
 
     try:
-        with open(abi_path, 'r') as f:
-            contract_json = json.load(f)
+        with open(abi_path, 'rb') as f:
+            contract_json = _json_loads(f.read())
+            if isinstance(contract_json, dict) and 'abi' in contract_json:
+                # Artefacto Hardhat (ex.: FlashLoanReceiver.json): a ABI vem no campo 'abi'
+                contract_json = contract_json['abi']
 
             if isinstance(contract_json, list):
-                logger.info(f"ABI carregada com sucesso do arquivo: {abi_filename} com {len(contract_json)} entradas.")
+                logger.info("ABI carregada com sucesso do arquivo: %s com %d entradas.", abi_filename, len(contract_json))
+                _abi_cache[abi_path] = contract_json
                 return contract_json
             else:
-                logger.error(f"Formato inválido de ABI no arquivo: {abi_path}. Esperado uma lista.")
+                logger.error("Formato inválido de ABI no arquivo: %s. Esperado uma lista.", abi_path)
                 raise ValueError(f"Formato inválido de ABI no arquivo: {abi_path}. Esperado uma lista.")
 
     except json.JSONDecodeError as e:
-        logger.error(f"Erro ao decodificar o arquivo ABI ({abi_path}): {e}")
+        # orjson.JSONDecodeError é subclasse de json.JSONDecodeError
+        logger.error("Erro ao decodificar o arquivo ABI (%s): %s", abi_path, e)
         raise
 
     except Exception as e:
-        logger.error(f"Erro inesperado ao carregar o arquivo ABI ({abi_path}): {e}")
+        logger.error("Erro inesperado ao carregar o arquivo ABI (%s): %s", abi_path, e)
         raise
@@ -1,11 +1,18 @@
 import os
 import sys
-import json
 import logging
 from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from dotenv import load_dotenv
-from web3 import Web3
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Any
+from web3 import Web3, HTTPProvider
+from web3.types import RPCEndpoint, RPCResponse
 from web3.middleware.geth_poa import geth_poa_middleware
+from web3.middleware import construct_simple_cache_middleware
 
 # --- 1. CONFIGURAÇÃO DE CAMINHOS E LOGGER ---
 
@@ -15,6 +22,8 @@ sys.path.append(BASE_DIR)
 
 # A dependência do NonceManager é mantida, pois é uma classe com estado
 from utils.nonce_utils import NonceManager
+from utils import token_cache
+from utils.abi_utils import carregar_abi
 
 def configurar_logger():
     """Configura um logger centralizado para o projeto."""
@@ -22,13 +31,19 @@ def configurar_logger():
     os.makedirs(log_dir, exist_ok=True)
     log_filename = os.path.join(log_dir, "bot_zeus.log")
 
+    # Nível do ficheiro (LOG_FILE_LEVEL, INFO por omissão). O logger adota o mesmo nível,
+    # pelo que chamadas DEBUG são descartadas antes de formatar a mensagem.
+    file_level = logging.getLevelName(os.getenv("LOG_FILE_LEVEL", "INFO").upper())
+    if not isinstance(file_level, int):
+        file_level = logging.INFO
+
     logger = logging.getLogger("bot_zeus")
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(min(file_level, logging.INFO))
 
     if not logger.handlers:
         # Handler para o ficheiro de log
         file_handler = logging.FileHandler(log_filename)
-        file_handler.setLevel(logging.DEBUG)
+        file_handler.setLevel(file_level)
         formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(module)s - %(message)s")
         file_handler.setFormatter(formatter)
         logger.addHandler(file_handler)
@@ -41,18 +56,23 @@ def configurar_logger():
 
     return logger
 
+# .env carregado antes do logger para que LOG_FILE_LEVEL seja respeitado
+load_dotenv()
 logger = configurar_logger()
 
 
 # --- 2. CARREGAMENTO DE VARIÁVEIS DE AMBIENTE E CONFIGURAÇÕES WEB3 ---
 
-load_dotenv()
+@lru_cache(maxsize=4096)
+def obter_checksum(endereco: str) -> str:
+    """Web3.to_checksum_address memoizado (evita recalcular keccak por chamada)."""
+    return Web3.to_checksum_address(endereco)
 
 def obter_variavel_ambiente(nome_variavel: str) -> str:
     """Obtém uma variável de ambiente ou lança um erro crítico."""
     valor = os.getenv(nome_variavel)
     if not valor:
-        logger.critical(f"Variável de ambiente '{nome_variavel}' não definida. Verifique o ficheiro .env.")
+        logger.critical("Variável de ambiente '%s' não definida. Verifique o ficheiro .env.", nome_variavel)
         raise ValueError(f"'{nome_variavel}' não está definida.")
     return valor
 
@@ -60,16 +80,45 @@ def obter_variavel_ambiente_opcional(nome_variavel: str) -> str | None:
     """Obtém uma variável de ambiente opcional; retorna None se ausente."""
     valor = os.getenv(nome_variavel)
     if not valor:
-        logger.warning(f"Variável de ambiente opcional '{nome_variavel}' não definida. Será tentada a inferência automática quando possível.")
+        logger.warning("Variável de ambiente opcional '%s' não definida. Será tentada a inferência automática quando possível.", nome_variavel)
         return None
     return valor
 
+# Variáveis obrigatórias: lidas de uma só vez; todas as ausentes são reportadas juntas
+VARIAVEIS_OBRIGATORIAS = [
+    "WALLET_ADDRESS",
+    "PRIVATE_KEY",
+    "FLASHLOAN_CONTRACT_ADDRESS",
+    "UNISWAP_V3_ROUTER_ADDRESS",
+    "QUOTER_ADDRESS",
+    "SUSHISWAP_ROUTER_ADDRESS",
+    "QUICKSWAP_ROUTER_ADDRESS",
+    "USDC_ADDRESS",
+    "WETH_ADDRESS",
+    "DAI_ADDRESS",
+    "WMATIC_ADDRESS",
+    "USDT_ADDRESS",
+]
+
+def carregar_variaveis_obrigatorias(nomes: list[str]) -> dict[str, str]:
+    """Lê todas as variáveis obrigatórias; lança ValueError com a lista completa das ausentes."""
+    env = {nome: os.environ[nome] for nome in nomes if os.environ.get(nome)}
+    em_falta = [nome for nome in nomes if nome not in env]
+    if em_falta:
+        logger.critical("Variáveis de ambiente não definidas: %s. Verifique o ficheiro .env.", ", ".join(em_falta))
+        raise ValueError(f"Variáveis em falta: {', '.join(em_falta)}")
+    return env
+
 try:
+    _env = carregar_variaveis_obrigatorias(VARIAVEIS_OBRIGATORIAS)
+
     # Configurações da carteira e do provedor
-    WALLET_ADDRESS = Web3.to_checksum_address(obter_variavel_ambiente("WALLET_ADDRESS"))
-    PRIVATE_KEY = obter_variavel_ambiente("PRIVATE_KEY")
+    WALLET_ADDRESS = obter_checksum(_env["WALLET_ADDRESS"])
+    PRIVATE_KEY = _env["PRIVATE_KEY"]
     # Provedores RPC: suporte a múltiplos via fallback
-    # Ordem de preferência: CUSTOM_RPC_URL -> INFURA_URL -> RPC_URL -> FORK_RPC_URL -> LOCAL_RPC_URL -> http://127.0.0.1:8545
+    # Ordem de preferência: CUSTOM_RPC_URL -> INFURA_URL -> ALCHEMY_URL -> RPC_URL (só HTTP).
+    # WS_URL não entra aqui: serve apenas a subscrição newHeads (rpc_utils), porque o
+    # WebsocketProvider do web3 6 usa um único socket e não é seguro entre as threads de varredura.
     PROVIDER_CANDIDATES = [
         os.getenv("CUSTOM_RPC_URL"),
         os.getenv("INFURA_URL"),
@@ -78,93 +127,225 @@ try:
     ]
 
     # Endereços dos contratos
-    FLASHLOAN_CONTRACT_ADDRESS = Web3.to_checksum_address(obter_variavel_ambiente("FLASHLOAN_CONTRACT_ADDRESS"))
+    FLASHLOAN_CONTRACT_ADDRESS = obter_checksum(_env["FLASHLOAN_CONTRACT_ADDRESS"])
     # Suporte opcional a um segundo contrato (V2) com V3 multi-hop
     USE_FLASHLOAN_V2 = os.getenv("USE_FLASHLOAN_V2", "0").lower() in ("1", "true", "yes", "on")
     _fl_v2 = obter_variavel_ambiente_opcional("FLASHLOAN_CONTRACT_ADDRESS_V2")
-    FLASHLOAN_CONTRACT_ADDRESS_V2 = Web3.to_checksum_address(_fl_v2) if _fl_v2 else None
-    UNISWAP_V3_ROUTER_ADDRESS = Web3.to_checksum_address(obter_variavel_ambiente("UNISWAP_V3_ROUTER_ADDRESS"))
-    QUOTER_ADDRESS = Web3.to_checksum_address(obter_variavel_ambiente("QUOTER_ADDRESS"))
-    SUSHISWAP_ROUTER_ADDRESS = Web3.to_checksum_address(obter_variavel_ambiente("SUSHISWAP_ROUTER_ADDRESS"))
-    QUICKSWAP_ROUTER_ADDRESS = Web3.to_checksum_address(obter_variavel_ambiente("QUICKSWAP_ROUTER_ADDRESS"))
+    FLASHLOAN_CONTRACT_ADDRESS_V2 = obter_checksum(_fl_v2) if _fl_v2 else None
+    UNISWAP_V3_ROUTER_ADDRESS = obter_checksum(_env["UNISWAP_V3_ROUTER_ADDRESS"])
+    QUOTER_ADDRESS = obter_checksum(_env["QUOTER_ADDRESS"])
+    SUSHISWAP_ROUTER_ADDRESS = obter_checksum(_env["SUSHISWAP_ROUTER_ADDRESS"])
+    QUICKSWAP_ROUTER_ADDRESS = obter_checksum(_env["QUICKSWAP_ROUTER_ADDRESS"])
     # Factories V2: agora opcionais; se ausentes, serão inferidas via router.factory()
     _qf = obter_variavel_ambiente_opcional("QUICKSWAP_FACTORY_ADDRESS")
-    QUICKSWAP_FACTORY_ADDRESS = Web3.to_checksum_address(_qf) if _qf else None
+    QUICKSWAP_FACTORY_ADDRESS = obter_checksum(_qf) if _qf else None
     _sf = obter_variavel_ambiente_opcional("SUSHISWAP_FACTORY_ADDRESS")
-    SUSHISWAP_FACTORY_ADDRESS = Web3.to_checksum_address(_sf) if _sf else None
+    SUSHISWAP_FACTORY_ADDRESS = obter_checksum(_sf) if _sf else None
+    # Factory Uniswap V3 (mesmo endereço em todas as redes oficiais, incl. Polygon); usada para
+    # sondar a existência de pools antes de cotar caminhos multi-hop
+    UNISWAP_V3_FACTORY_ADDRESS = obter_checksum(
+        obter_variavel_ambiente_opcional("UNISWAP_V3_FACTORY_ADDRESS") or "0x1F98431c8aD98523631AE4a59f267346ea31F984"
+    )
 
     # Endereços dos tokens
-    USDC_ADDRESS = Web3.to_checksum_address(obter_variavel_ambiente("USDC_ADDRESS"))
-    WETH_ADDRESS = Web3.to_checksum_address(obter_variavel_ambiente("WETH_ADDRESS"))
-    DAI_ADDRESS = Web3.to_checksum_address(obter_variavel_ambiente("DAI_ADDRESS"))
-    WMATIC_ADDRESS = Web3.to_checksum_address(obter_variavel_ambiente("WMATIC_ADDRESS"))
-    USDT_ADDRESS = Web3.to_checksum_address(obter_variavel_ambiente("USDT_ADDRESS"))
+    USDC_ADDRESS = obter_checksum(_env["USDC_ADDRESS"])
+    WETH_ADDRESS = obter_checksum(_env["WETH_ADDRESS"])
+    DAI_ADDRESS = obter_checksum(_env["DAI_ADDRESS"])
+    WMATIC_ADDRESS = obter_checksum(_env["WMATIC_ADDRESS"])
+    USDT_ADDRESS = obter_checksum(_env["USDT_ADDRESS"])
 
 except ValueError as e:
     logger.critical(f"Erro ao carregar configuração inicial: {e}")
     sys.exit(1)
 
+def criar_sessao_http() -> requests.Session:
+    """Sessão HTTP com pool de conexões keep-alive para o provider RPC.
+
+    Reutiliza TCP/TLS entre chamadas (evita um handshake por eth_call) e
+    dimensiona o pool para as threads de varredura em paralelo.
+    """
+    pool_maxsize = int(os.getenv("RPC_POOL_MAXSIZE", "64"))
+    adapter = HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=pool_maxsize,
+        # Sem bloqueio: com o pool esgotado abre-se uma conexão extra em vez de esperar
+        pool_block=False,
+        # Reenvio no transporte só em erros de ligação (o pedido nunca chegou ao nó). Sem
+        # reenvio após timeout de leitura ou 5xx: a mesma sessão serve eth_sendRawTransaction,
+        # e um envio repetido de uma tx já aceite falharia com "already known"/"nonce too low".
+        max_retries=Retry(
+            total=2,
+            connect=2,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=0.05,
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False,
+        ),
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+_sessoes_http: dict[str, requests.Session] = {}
+
+def obter_sessao_http(url: str) -> requests.Session:
+    """Sessão pooled por URL, partilhada pelo provider e pelos lotes JSON-RPC."""
+    sessao = _sessoes_http.get(url)
+    if sessao is None:
+        sessao = _sessoes_http[url] = criar_sessao_http()
+    return sessao
+
+def enviar_lote_rpc(w3: Web3, chamadas: list[tuple[str, list]]) -> list:
+    """
+    Envia várias chamadas JSON-RPC num único POST (array JSON-RPC 2.0).
+
+    Args:
+        w3: Instância Web3 com HTTPProvider (usa o mesmo endpoint e sessão).
+        chamadas: Lista de (método, params), ex.: ("eth_call", [{...}, "latest"]).
+
+    Returns:
+        Os campos 'result' na ordem das chamadas; None para entradas com erro.
+    """
+    url = w3.provider.endpoint_uri
+    if not str(url).startswith(("http://", "https://")):
+        raise ValueError(f"Lote JSON-RPC requer provider HTTP (atual: {url})")
+    payload = [
+        {"jsonrpc": "2.0", "id": i, "method": metodo, "params": params}
+        for i, (metodo, params) in enumerate(chamadas)
+    ]
+    resp = obter_sessao_http(url).post(url, json=payload, timeout=float(os.getenv("RPC_TIMEOUT_SECONDS", "10")))
+    resp.raise_for_status()
+    dados = resp.json()
+    if not isinstance(dados, list):
+        # Nós sem suporte a lotes devolvem um único objeto de erro
+        raise ValueError(f"Resposta inválida ao lote JSON-RPC: {dados}")
+    por_id = {d.get("id"): d for d in dados if isinstance(d, dict)}
+    return [por_id.get(i, {}).get("result") for i in range(len(chamadas))]
+
+class ProviderHTTPPartilhado(HTTPProvider):
+    """
+    HTTPProvider cujo POST passa sempre pela sessão pooled de obter_sessao_http(url).
+
+    O web3 6 guarda a sessão por thread (threading.get_ident()): a sessão passada ao construtor
+    só serviria a thread que criou o provider, e as threads dos pools de varredura/cotação
+    usariam uma requests.Session por omissão, sem o pool dimensionado nem o Retry de ligação.
+    """
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        request_data = self.encode_rpc_request(method, params)
+        resposta = obter_sessao_http(self.endpoint_uri).post(
+            self.endpoint_uri, data=request_data, **self.get_request_kwargs()
+        )
+        resposta.raise_for_status()
+        return self.decode_rpc_response(resposta.content)
+
+def criar_provider(url: str):
+    """HTTPProvider com sessão pooled (keep-alive) partilhada por todas as threads."""
+    timeout = float(os.getenv("RPC_TIMEOUT_SECONDS", "10"))
+    return ProviderHTTPPartilhado(url, request_kwargs={"timeout": timeout})
+
+def construir_web3(url: str) -> Web3:
+    """
+    Instância Web3 para o URL com os middlewares do bot: POA (Polygon) e um cache simples,
+    próprio da instância, das RPCs idempotentes (eth_chainId, net_version, ...).
+    """
+    w3 = Web3(criar_provider(url))
+    w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+    w3.middleware_onion.add(construct_simple_cache_middleware(), name="simple_cache")
+    return w3
+
+def sondar_rede(w3: Web3, carteira: str) -> tuple[int, int | None]:
+    """
+    Sonda de arranque: eth_chainId e o nonce 'pending' da carteira num único lote JSON-RPC
+    (1 RTT em vez de 2). Sem suporte a lotes no nó, recorre a
+    eth_chainId e devolve nonce None, ficando a sincronização a cargo do NonceManager.
+    """
+    try:
+        chain_id_hex, nonce_hex = enviar_lote_rpc(w3, [
+            ("eth_chainId", []),
+            ("eth_getTransactionCount", [carteira, "pending"]),
+        ])
+        if chain_id_hex is not None:
+            return int(chain_id_hex, 16), (int(nonce_hex, 16) if nonce_hex is not None else None)
+    except Exception:
+        pass
+    return w3.eth.chain_id, None
+
 # Instância Web3
+# A sonda de conexão é o próprio eth_chainId (em lote com o nonce da carteira): uma única RPC
+# bloqueante no import, e o valor fica disponível em config["chain_id"].
 last_err = None
 web3_instance = None
 chosen_url = None
-rpc_timeout = float(os.getenv("RPC_TIMEOUT_SECONDS", "10"))
-for candidate in [url for url in PROVIDER_CANDIDATES if url]:
+net_id = None
+nonce_inicial = None
+for candidate in [url for url in PROVIDER_CANDIDATES if url and url.startswith(("http://", "https://"))]:
     try:
-        w3 = Web3(Web3.HTTPProvider(candidate, request_kwargs={"timeout": rpc_timeout}))
-        w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-        if w3.is_connected():
-            web3_instance = w3
-            chosen_url = candidate
-            break
-        else:
-            last_err = RuntimeError(f"Não conectou em {candidate}")
+        w3 = construir_web3(candidate)
+        net_id, nonce_inicial = sondar_rede(w3, WALLET_ADDRESS)
+        web3_instance = w3
+        chosen_url = candidate
+        break
     except Exception as e:
         last_err = e
 
 if web3_instance is None:
     logger.critical("Falha na conexão com o nó da Polygon. Verifique sua variável INFURA_URL/RPC_URL ou inicialize seu nó local.")
     if last_err:
-        logger.critical(f"Último erro: {last_err}")
+        logger.critical("Último erro: %s", last_err)
     raise ConnectionError("Não foi possível conectar à rede Polygon.")
 
-try:
-    net_id = web3_instance.eth.chain_id
-except Exception:
-    net_id = 'desconhecido'
-logger.info(f"Conexão com a rede Polygon estabelecida com sucesso. URL: {chosen_url} | chainId: {net_id}")
+logger.info("Conexão com a rede Polygon estabelecida com sucesso. URL: %s | chainId: %s", chosen_url, net_id)
 
 
 # --- 3. FUNÇÕES UTILITÁRIAS E CARREGAMENTO DE CONTRATOS ---
 
 ABIS_DIR = os.path.join(BASE_DIR, 'abis')
 
+# Caches de processo: cada ABI é lida/parseada uma vez (cache de abi_utils); contratos
+# reutilizados por (ABI, endereço)
+_contratos_cache: dict[tuple[str, str, int], object] = {}
+
 def carregar_abi_localmente(nome_ficheiro_abi: str) -> list:
-    caminho_abi = os.path.join(ABIS_DIR, nome_ficheiro_abi)
     try:
-        with open(caminho_abi, 'r') as f:
-            data = json.load(f)
-            if isinstance(data, dict) and 'abi' in data:
-                return data['abi']
-            elif isinstance(data, list):
-                return data
-            else:
-                raise ValueError("Formato de ABI inválido.")
+        return carregar_abi(nome_ficheiro_abi)
     except Exception as e:
-        logger.critical(f"Erro ao ler o ficheiro ABI '{nome_ficheiro_abi}': {e}")
+        logger.critical("Erro ao ler o ficheiro ABI '%s': %s", nome_ficheiro_abi, e)
         raise
 
+def pre_carregar_abis() -> None:
+    """Lê todas as ABIs de ABIS_DIR para o cache no arranque (ficheiros .dbg.json são ignorados)."""
+    for nome in sorted(os.listdir(ABIS_DIR)):
+        if not nome.endswith('.json') or nome.endswith('.dbg.json'):
+            continue
+        try:
+            carregar_abi_localmente(nome)
+        except Exception:
+            # Já registado em carregar_abi_localmente; a ABI volta a ser tentada sob demanda
+            continue
+
+pre_carregar_abis()
+
 def carregar_contrato(abi_nome: str, endereco: str, nome_legivel: str):
     try:
         if web3_instance is None:
             raise RuntimeError("web3_instance não foi inicializado (sem conexão RPC).")
-        checksum_address = Web3.to_checksum_address(endereco)
+        checksum_address = obter_checksum(endereco)
+        # Um contrato por instância Web3: num failover de ida e volta entre os mesmos providers
+        # (instâncias reutilizadas por URL em rpc_utils) os contratos já construídos são reaproveitados
+        chave = (abi_nome, checksum_address, id(web3_instance))
+        contrato = _contratos_cache.get(chave)
+        if contrato is not None and contrato.w3 is web3_instance:
+            return contrato
         abi = carregar_abi_localmente(abi_nome)
         contrato = web3_instance.eth.contract(address=checksum_address, abi=abi)
-        logger.info(f"Contrato {nome_legivel} em {checksum_address} carregado.")
+        _contratos_cache[chave] = contrato
+        logger.info("Contrato %s em %s carregado.", nome_legivel, checksum_address)
         return contrato
     except Exception as e:
-        logger.critical(f"Falha ao carregar o contrato {nome_legivel}: {e}")
+        logger.critical("Falha ao carregar o contrato %s: %s", nome_legivel, e)
         raise
 
 # Dicionário de Tokens com seus decimais
@@ -199,103 +380,174 @@ V3_FEE_CHOICES = _parse_int_list(os.getenv("V3_FEE_CHOICES", ""), [500, 3000])
 V3_MAX_HOPS = int(os.getenv("V3_MAX_HOPS", "1"))  # 0=single-hop, 1=um hub, 2=dois hubs
 V2_MAX_HOPS = int(os.getenv("V2_MAX_HOPS", "1"))  # 0=direct, 1=um hub, 2=dois hubs
 
-_token_decimals_cache = {}
+# Contratos ERC20 reutilizados por token (construir um Contract liga todas as funções da ABI)
+_erc20_contratos: dict[str, object] = {}
+
+def obter_contrato_erc20(w3: Web3, token_address: str):
+    """Contrato ERC20 do token, criado uma vez por endereço e por instância Web3."""
+    endereco = obter_checksum(token_address)
+    contrato = _erc20_contratos.get(endereco)
+    if contrato is None or contrato.w3 is not w3:
+        contrato = w3.eth.contract(address=endereco, abi=carregar_abi_localmente("ERC20.json"))
+        _erc20_contratos[endereco] = contrato
+    return contrato
+
+# Pré-populado com o cache em disco e o catálogo (chaves já em checksum): sem varrer TOKENS por chamada
+_token_decimals_cache = token_cache.carregar()
+_token_decimals_cache.update({info["address"]: info["decimals"] for info in TOKENS.values()})
 def obter_decimais_token(w3: Web3, token_address: str) -> int:
     """Obtém dinamicamente os decimais de um token ERC20, com cache."""
-    token_address_cs = Web3.to_checksum_address(token_address)
+    token_address_cs = obter_checksum(token_address)
     if token_address_cs in _token_decimals_cache:
         return _token_decimals_cache[token_address_cs]
-    for token_info in TOKENS.values():
-        if token_info["address"] == token_address_cs:
-            _token_decimals_cache[token_address_cs] = token_info["decimals"]
-            return token_info["decimals"]
     try:
-        erc20_abi = carregar_abi_localmente("ERC20.json")
-        token_contract = w3.eth.contract(address=token_address_cs, abi=erc20_abi)
-        decimals = token_contract.functions.decimals().call()
+        decimals = obter_contrato_erc20(w3, token_address_cs).functions.decimals().call()
         _token_decimals_cache[token_address_cs] = decimals
+        token_cache.salvar({token_address_cs: decimals})
         return decimals
     except Exception:
-        logger.warning(f"Não foi possível obter decimais para {token_address_cs}. Assumindo 18.")
+        logger.warning("Não foi possível obter decimais para %s. Assumindo 18.", token_address_cs)
         return 18
 
+# Potências de 10 pré-calculadas para todo o domínio de decimals() (uint8: 0-255), sem IndexError
+# num token com decimais fora do habitual
+_POW10 = [10 ** i for i in range(256)]
+# Mesmos fatores já como Decimal, para a conversão inversa sem Decimal(10) ** d por chamada
+_DEC_POW10 = [Decimal(p) for p in _POW10]
+
+def _para_unidade_base(quantidade: float | int | Decimal, decimais: int) -> int:
+    if type(quantidade) is int:
+        # Quantidade inteira de tokens: uma única multiplicação
+        return quantidade * _POW10[decimais]
+    texto = str(quantidade)
+    if 'e' in texto or 'E' in texto:
+        # Notação científica (ex.: 1e-05): caminho exato via Decimal
+        return int(Decimal(texto) * _POW10[decimais])
+    # Aritmética inteira sobre a representação decimal; trunca como int(Decimal(...))
+    inteiro, _, fracao = texto.partition('.')
+    fracao = fracao[:decimais]
+    return int(inteiro + fracao) * _POW10[decimais - len(fracao)]
+
 def converter_para_unidade_base(w3: Web3, quantidade: float, token_address: str) -> int:
+    return _para_unidade_base(quantidade, obter_decimais_token(w3, token_address))
+
+def converter_para_unidade_base_lote(w3: Web3, quantidades, token_address: str) -> list[int]:
+    """Converte uma escada de tamanhos do mesmo token; os decimais são resolvidos uma única vez."""
     decimais = obter_decimais_token(w3, token_address)
-    fator = Decimal(10) ** decimais
-    return int(Decimal(str(quantidade)) * fator)
+    return [_para_unidade_base(q, decimais) for q in quantidades]
 
 def converter_de_unidade_base(w3: Web3, quantidade: int, token_address: str) -> Decimal:
     decimais = obter_decimais_token(w3, token_address)
-    fator = Decimal(10) ** decimais
-    return Decimal(quantidade) / fator
+    return Decimal(quantidade) / _DEC_POW10[decimais]
 
 
 # --- 4. INSTANCIAÇÃO DE OBJETOS E CRIAÇÃO DO DICIONÁRIO DE CONFIGURAÇÃO ---
 
-nonce_manager = NonceManager(web3_instance, WALLET_ADDRESS)
-
-# Contratos das DEXs
-uniswap_v3_router = carregar_contrato("ISwapRouter.json", UNISWAP_V3_ROUTER_ADDRESS, "Uniswap V3 Router")
-uniswap_v3_quoter = carregar_contrato("IQuoter.json", QUOTER_ADDRESS, "Uniswap V3 Quoter")
-
-# Routers V2
-sushiswap_router = carregar_contrato("SushiswapV2Router02.json", SUSHISWAP_ROUTER_ADDRESS, "SushiSwap V2 Router")
-quickswap_router = carregar_contrato("QuickswapV2Router02.json", QUICKSWAP_ROUTER_ADDRESS, "QuickSwap V2 Router")
-
-# Tentar inferir as factories via router.factory() caso não venham do .env
-if SUSHISWAP_FACTORY_ADDRESS is None:
+nonce_manager = NonceManager(web3_instance, WALLET_ADDRESS, nonce_inicial)
+
+def carregar_contratos_em_paralelo(specs: list[tuple[str, str, str]]) -> list:
+    """Carrega vários contratos (leitura de ABI + instanciação) em paralelo; mantém a ordem de specs."""
+    with ThreadPoolExecutor(max_workers=min(8, len(specs)), thread_name_prefix="bootstrap") as executor:
+        return list(executor.map(lambda spec: carregar_contrato(*spec), specs))
+
+# Contratos das DEXs (Uniswap V3) e routers V2
+uniswap_v3_router, uniswap_v3_quoter, sushiswap_router, quickswap_router = carregar_contratos_em_paralelo([
+    ("ISwapRouter.json", UNISWAP_V3_ROUTER_ADDRESS, "Uniswap V3 Router"),
+    ("IQuoter.json", QUOTER_ADDRESS, "Uniswap V3 Quoter"),
+    ("SushiswapV2Router02.json", SUSHISWAP_ROUTER_ADDRESS, "SushiSwap V2 Router"),
+    ("QuickswapV2Router02.json", QUICKSWAP_ROUTER_ADDRESS, "QuickSwap V2 Router"),
+])
+
+# Tentar inferir as factories via router.factory() caso não venham do .env.
+# As leituras pendentes seguem num único lote JSON-RPC (1 RTT em vez de um por router).
+_FACTORY_SELECTOR = Web3.to_hex(Web3.keccak(text="factory()")[:4])
+_routers_sem_factory = [
+    (nome, router, env_var)
+    for nome, router, endereco, env_var in (
+        ("SushiSwap", sushiswap_router, SUSHISWAP_FACTORY_ADDRESS, "SUSHISWAP_FACTORY_ADDRESS"),
+        ("QuickSwap", quickswap_router, QUICKSWAP_FACTORY_ADDRESS, "QUICKSWAP_FACTORY_ADDRESS"),
+    )
+    if endereco is None
+]
+if _routers_sem_factory:
     try:
-        inferred = sushiswap_router.functions.factory().call()
-        SUSHISWAP_FACTORY_ADDRESS = Web3.to_checksum_address(inferred)
-        logger.info(f"SushiSwap V2 Factory inferida via router: {SUSHISWAP_FACTORY_ADDRESS}")
+        _resultados_factory = enviar_lote_rpc(web3_instance, [
+            ("eth_call", [{"to": router.address, "data": _FACTORY_SELECTOR}, "latest"])
+            for _, router, _ in _routers_sem_factory
+        ])
     except Exception as e:
-        logger.critical(f"Não foi possível inferir a SushiSwap V2 Factory via router. Defina SUSHISWAP_FACTORY_ADDRESS no .env. Erro: {e}")
-        raise
+        logger.warning("Lote JSON-RPC indisponível para inferir factories (%s). Usando chamadas individuais.", e)
+        _resultados_factory = [None] * len(_routers_sem_factory)
+
+    _factories_inferidas = {}
+    for (nome, router, env_var), resultado in zip(_routers_sem_factory, _resultados_factory):
+        try:
+            if resultado and len(resultado) >= 42:
+                inferred = "0x" + resultado[-40:]
+            else:
+                inferred = router.functions.factory().call()
+            _factories_inferidas[nome] = Web3.to_checksum_address(inferred)
+            logger.info("%s V2 Factory inferida via router: %s", nome, _factories_inferidas[nome])
+        except Exception as e:
+            logger.critical("Não foi possível inferir a %s V2 Factory via router. Defina %s no .env. Erro: %s", nome, env_var, e)
+            raise
+    SUSHISWAP_FACTORY_ADDRESS = _factories_inferidas.get("SushiSwap", SUSHISWAP_FACTORY_ADDRESS)
+    QUICKSWAP_FACTORY_ADDRESS = _factories_inferidas.get("QuickSwap", QUICKSWAP_FACTORY_ADDRESS)
 
-if QUICKSWAP_FACTORY_ADDRESS is None:
-    try:
-        inferred = quickswap_router.functions.factory().call()
-        QUICKSWAP_FACTORY_ADDRESS = Web3.to_checksum_address(inferred)
-        logger.info(f"QuickSwap V2 Factory inferida via router: {QUICKSWAP_FACTORY_ADDRESS}")
-    except Exception as e:
-        logger.critical(f"Não foi possível inferir a QuickSwap V2 Factory via router. Defina QUICKSWAP_FACTORY_ADDRESS no .env. Erro: {e}")
-        raise
+if 'USE_FLASHLOAN_V2' in globals() and USE_FLASHLOAN_V2:
+    if not FLASHLOAN_CONTRACT_ADDRESS_V2:
+        logger.critical("USE_FLASHLOAN_V2=on mas FLASHLOAN_CONTRACT_ADDRESS_V2 não foi definido no .env")
+        raise ValueError("Endereço do contrato V2 ausente")
+    _flashloan_spec = ("FlashLoanReceiverV2.json", FLASHLOAN_CONTRACT_ADDRESS_V2, "FlashLoan Receiver V2")
+    _active_flashloan_addr = FLASHLOAN_CONTRACT_ADDRESS_V2
+else:
+    _flashloan_spec = ("FlashLoanReceiver.json", FLASHLOAN_CONTRACT_ADDRESS, "FlashLoan Receiver")
+    _active_flashloan_addr = FLASHLOAN_CONTRACT_ADDRESS
 
-sushiswap_factory = carregar_contrato("SushiswapV2Factory.json", SUSHISWAP_FACTORY_ADDRESS, "SushiSwap V2 Factory")
-quickswap_factory = carregar_contrato("QuickswapV2Factory.json", QUICKSWAP_FACTORY_ADDRESS, "QuickSwap V2 Factory")
+sushiswap_factory, quickswap_factory, flashloan_contract = carregar_contratos_em_paralelo([
+    ("SushiswapV2Factory.json", SUSHISWAP_FACTORY_ADDRESS, "SushiSwap V2 Factory"),
+    ("QuickswapV2Factory.json", QUICKSWAP_FACTORY_ADDRESS, "QuickSwap V2 Factory"),
+    _flashloan_spec,
+])
 
 dex_contracts = {
     "UniswapV3": {
         "router": uniswap_v3_router,
         "quoter": uniswap_v3_quoter,
+        # Função de swap do router resolvida uma vez (evita introspecção por transação)
+        "swap_fn_name": "exactInputSingle",
     },
     "SushiSwapV2": {
         "router": sushiswap_router,
         "factory": sushiswap_factory,
         # CORREÇÃO: Adicionar o nome do ficheiro ABI do Pair explicitamente
-        "pair_abi_name": "SushiswapV2Pair.json"
+        "pair_abi_name": "SushiswapV2Pair.json",
+        "swap_fn_name": "swapExactTokensForTokens",
     },
     "QuickSwapV2": {
         "router": quickswap_router,
         "factory": quickswap_factory,
         # CORREÇÃO: Adicionar o nome do ficheiro ABI do Pair explicitamente
-        "pair_abi_name": "QuickswapV2Pair.json"
+        "pair_abi_name": "QuickswapV2Pair.json",
+        "swap_fn_name": "swapExactTokensForTokens",
     }
 }
 
-if 'USE_FLASHLOAN_V2' in globals() and USE_FLASHLOAN_V2:
-    if not FLASHLOAN_CONTRACT_ADDRESS_V2:
-        logger.critical("USE_FLASHLOAN_V2=on mas FLASHLOAN_CONTRACT_ADDRESS_V2 não foi definido no .env")
-        raise ValueError("Endereço do contrato V2 ausente")
-    flashloan_contract = carregar_contrato("FlashLoanReceiverV2.json", FLASHLOAN_CONTRACT_ADDRESS_V2, "FlashLoan Receiver V2")
-    _active_flashloan_addr = FLASHLOAN_CONTRACT_ADDRESS_V2
-else:
-    flashloan_contract = carregar_contrato("FlashLoanReceiver.json", FLASHLOAN_CONTRACT_ADDRESS, "FlashLoan Receiver")
-    _active_flashloan_addr = FLASHLOAN_CONTRACT_ADDRESS
+def vincular_funcoes_dex(dex_contracts: dict) -> dict:
+    """
+    Resolve uma única vez, por DEX, a função de swap do router, evitando a procura
+    por nome na ABI a cada transação. (As cotações usam calldata pré-codificada.)
+    """
+    for info in dex_contracts.values():
+        info["swap_fn"] = info["router"].get_function_by_name(info["swap_fn_name"])
+    return dex_contracts
+
+vincular_funcoes_dex(dex_contracts)
 
 # Dicionário de configuração final
 config = {
     "web3": web3_instance,
+    "chain_id": net_id,
     "logger": logger,
     "nonce_manager": nonce_manager,
     "dex_contracts": dex_contracts,
@@ -306,12 +558,16 @@ config = {
     "flashloan_contract_v1_address": FLASHLOAN_CONTRACT_ADDRESS,
     "flashloan_contract_v2_address": FLASHLOAN_CONTRACT_ADDRESS_V2,
     "active_flashloan_contract_address": _active_flashloan_addr,
+    "uniswap_v3_factory_address": UNISWAP_V3_FACTORY_ADDRESS,
     "use_flashloan_v2": bool('USE_FLASHLOAN_V2' in globals() and USE_FLASHLOAN_V2),
     "TOKENS": TOKENS,
     "to_base": converter_para_unidade_base,
+    "to_base_bulk": converter_para_unidade_base_lote,
     "from_base": converter_de_unidade_base,
     # CORREÇÃO: Expor a função de carregar ABI para outros módulos
     "carregar_abi_localmente": carregar_abi_localmente,
+    "erc20": obter_contrato_erc20,
+    "vincular_funcoes_dex": vincular_funcoes_dex,
     # Parâmetros operacionais configuráveis via .env
     # GAS_LIMIT: inteiro, limite de gás por transação
     # MIN_BALANCE_MATIC: decimal, saldo mínimo de MATIC exigido
@@ -322,9 +578,17 @@ config = {
     # Defaults mais tolerantes para produção (podem ser sobrescritos no .env)
     "slippage_bps": int(os.getenv("SLIPPAGE_BPS", "70")),
     "deadline_seconds": int(os.getenv("DEADLINE_SECONDS", "180")),
+    # Intervalo (s) entre consultas de recibo; o default do web3 (0.1s) gera 429 em RPCs públicos
+    "receipt_poll_latency": float(os.getenv("RECEIPT_POLL_LATENCY", "2.0")),
+    # Teto do backoff exponencial das consultas de recibo
+    "receipt_poll_max_latency": float(os.getenv("RECEIPT_POLL_MAX_LATENCY", "8.0")),
     # Parâmetros de varredura
     "scan_time_budget_seconds": int(os.getenv("SCAN_TIME_BUDGET_SECONDS", "120")),
     "scan_interval_seconds": int(os.getenv("SCAN_INTERVAL_SECONDS", "15")),
+    # Threads usadas para varrer tokens alvo em paralelo
+    "scan_workers": max(1, int(os.getenv("SCAN_WORKERS", "4"))),
+    # Multicall3 para agregar leituras; desativado (0) usa lotes JSON-RPC de eth_call
+    "use_multicall3": os.getenv("USE_MULTICALL3", "1").lower() in ("1","true","yes","on"),
     # Controle de escaneamento V3 multi-hop
     "v3_fee_choices": [int(x) for x in os.getenv("V3_FEES", "500,3000").split(",") if x.strip().isdigit()],
     "v3_max_hops": int(os.getenv("V3_MAX_HOPS", "2")),
@@ -9,7 +9,6 @@ como rebalanceamento de carteira, conversão de lucros, etc.
 import os
 import sys
 import time
-import json
 from web3 import Web3
 from web3.types import TxReceipt, TxParams
 from hexbytes import HexBytes
@@ -19,8 +18,9 @@ from eth_typing import ChecksumAddress
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(base_dir)
 
-from utils.config import config
+from utils.config import config, obter_checksum
 from utils.gas_utils import obter_taxa_gas
+from utils.liquidity_utils import obter_melhor_fee_v3
 
 # --- Variáveis Globais do Módulo ---
 web3: Web3 = config['web3']
@@ -29,6 +29,10 @@ wallet_address: ChecksumAddress = config['wallet_address']
 private_key = config['private_key']
 nonce_manager = config['nonce_manager']
 dex_contracts = config['dex_contracts']
+# Allowance conhecida por (token, spender): lida on-chain uma vez e mantida localmente.
+# O approve é feito por MAX_UINT256, pelo que só ocorre uma vez por (token, router).
+MAX_UINT256 = 2**256 - 1
+_allowance_cache: dict[tuple[str, str], int] = {}
 
 class SwapError(Exception):
     """Exceção base para erros durante um swap."""
@@ -45,12 +49,13 @@ def _enviar_e_aguardar_transacao(tx: TxParams) -> TxReceipt:
         signed_tx = web3.eth.account.sign_transaction(tx, private_key)
         tx_hash = web3.eth.send_raw_transaction(signed_tx.rawTransaction)
         logger.info(f"Transação enviada. Hash: {tx_hash.hex()}. A aguardar recibo...")
-        receipt = web3.eth.wait_for_transaction_receipt(tx_hash, timeout=180)
-        nonce_manager.incrementar_se_confirmado(receipt)
+        receipt = web3.eth.wait_for_transaction_receipt(
+            tx_hash, timeout=180, poll_latency=float(config.get('receipt_poll_latency', 2.0))
+        )
+        # O nonce já foi consumido na reserva (mesmo uma tx revertida o consome on-chain)
         return receipt
     except Exception as e:
-        # Em caso de erro, é crucial sincronizar o nonce para evitar falhas futuras
-        nonce_manager.sync_with_network()
+        # A sincronização do nonce fica a cargo do handler de realizar_swap (único chamador)
         raise SwapError(f"Falha na transação: {e}")
 
 def realizar_swap(
@@ -63,8 +68,8 @@ def realizar_swap(
     Realiza uma troca de tokens (swap) em uma DEX específica, incluindo a aprovação (approve).
     """
     try:
-        token_in_cs: ChecksumAddress = Web3.to_checksum_address(token_in_address)
-        token_out_cs: ChecksumAddress = Web3.to_checksum_address(token_out_address)
+        token_in_cs: ChecksumAddress = obter_checksum(token_in_address)
+        token_out_cs: ChecksumAddress = obter_checksum(token_out_address)
 
         logger.info(
             f"Iniciando swap de {quantidade_in} {token_in_cs[-6:]} para {token_out_cs[-6:]} na {dex_nome}."
@@ -78,44 +83,50 @@ def realizar_swap(
 
         quantidade_base_in = config['to_base'](web3, quantidade_in, token_in_cs)
 
-        with open(os.path.join(base_dir, 'abis', 'ERC20.json')) as f:
-            erc20_abi = json.load(f)
+        token_in_contract = config['erc20'](web3, token_in_cs)
         
-        token_in_contract = web3.eth.contract(address=token_in_cs, abi=erc20_abi)
-        
-        allowance = token_in_contract.functions.allowance(wallet_address, dex_router.address).call()
+        chave_allowance = (token_in_cs, dex_router.address)
+        allowance = _allowance_cache.get(chave_allowance)
+        if allowance is None:
+            allowance = token_in_contract.functions.allowance(wallet_address, dex_router.address).call()
+            _allowance_cache[chave_allowance] = allowance
         if allowance < quantidade_base_in:
-            logger.info(f"Aprovação necessária para {dex_nome}. A aprovar {quantidade_in} de {token_in_cs[-6:]}...")
+            logger.info(f"Aprovação necessária para {dex_nome}. A aprovar {token_in_cs[-6:]} (ilimitado)...")
             
-            approve_tx_func = token_in_contract.functions.approve(dex_router.address, quantidade_base_in)
+            approve_tx_func = token_in_contract.functions.approve(dex_router.address, MAX_UINT256)
             
             approve_tx = approve_tx_func.build_transaction({
                 'from': wallet_address,
-                'nonce': nonce_manager.get_nonce(refresh=True),
+                'nonce': nonce_manager.reserve_nonce(),
                 'gasPrice': Web3.to_wei(obter_taxa_gas(web3, logger), 'gwei'),
                 # O gás será estimado pela função _enviar_e_aguardar_transacao
             })
             
             receipt_approve = _enviar_e_aguardar_transacao(approve_tx)
             if receipt_approve.get('status') != 1:
+                _allowance_cache.pop(chave_allowance, None)
                 raise SwapError("A transação de aprovação (approve) falhou.")
+            _allowance_cache[chave_allowance] = MAX_UINT256
             logger.info("Aprovação concedida com sucesso.")
 
-        if dex_nome == "UniswapV3":
-            tx_func = dex_router.functions.exactInputSingle({
-                'tokenIn': token_in_cs, 'tokenOut': token_out_cs, 'fee': 3000, 
+        swap_fn_name = dex_info['swap_fn_name']
+        swap_fn = dex_info['swap_fn']
+        if swap_fn_name == "exactInputSingle":
+            tx_func = swap_fn({
+                'tokenIn': token_in_cs, 'tokenOut': token_out_cs,
+                'fee': obter_melhor_fee_v3(token_in_cs, token_out_cs, quantidade_base_in),
                 'recipient': wallet_address, 'deadline': int(time.time()) + 300, 
                 'amountIn': quantidade_base_in, 'amountOutMinimum': 0, 'sqrtPriceLimitX96': 0
             })
         else: # Para DEXs V2
             path = [token_in_cs, token_out_cs]
-            tx_func = dex_router.functions.swapExactTokensForTokens(
+            tx_func = swap_fn(
                 quantidade_base_in, 0, path, wallet_address, int(time.time()) + 300
             )
 
         swap_tx = tx_func.build_transaction({
             'from': wallet_address,
-            'nonce': nonce_manager.get_nonce(),
+            'nonce': nonce_manager.reserve_nonce(),
             'gasPrice': Web3.to_wei(obter_taxa_gas(web3, logger), 'gwei'),
             # O gás será estimado pela função _enviar_e_aguardar_transacao
         })
@@ -123,11 +134,17 @@ def realizar_swap(
         receipt_swap = _enviar_e_aguardar_transacao(swap_tx)
         if receipt_swap.get('status') != 1:
             raise SwapError("A transação de swap falhou.")
+        # O router consumiu quantidade_base_in da allowance (tokens com MAX não decrementam,
+        # mas subtrair mantém o valor local como limite inferior seguro)
+        _allowance_cache[chave_allowance] = max(0, _allowance_cache.get(chave_allowance, 0) - quantidade_base_in)
             
         logger.info("Swap realizado com sucesso!")
         return receipt_swap
 
     except Exception as e:
         logger.error(f"Falha ao realizar o swap: {e}", exc_info=True)
+        # Um nonce reservado pode não ter chegado à rede (ex.: falha no build_transaction ou no envio);
+        # sincronização única para todo o caminho de falha do swap
+        nonce_manager.sync_with_network()
         raise SwapError(f"Falha no swap: {e}")
 
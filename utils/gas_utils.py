@@ -1,11 +1,70 @@
 # utils/gas_utils.py
 import requests
+from requests.adapters import HTTPAdapter
 from web3 import Web3
-from time import sleep
+from time import sleep, monotonic
 import os
 import logging
+import threading
+
+# O preço de gás só muda de forma relevante à escala do bloco (~2s na Polygon):
+# o último valor é reutilizado dentro do TTL, por tipo (Safe/Propose/Fast).
+GAS_PRICE_TTL_SECONDS = float(os.getenv("GAS_PRICE_TTL_SECONDS", "2"))
+_gas_cache: dict[str, tuple[float, float]] = {}
+# O lock protege apenas o dicionário; a consulta (até ~36s com as tentativas à Polygonscan)
+# corre fora dele. Uma só thread renova cada tipo: as restantes servem-se do último valor ou,
+# sem valor nenhum, aguardam o evento dessa consulta.
+_gas_lock = threading.Lock()
+_gas_em_curso: dict[str, threading.Event] = {}
+
+# Sessão keep-alive partilhada para a API Polygonscan (sem novo handshake TCP/TLS por consulta)
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
 
 def obter_taxa_gas(web3_instance, logger, retries=3, delay=2, timeout=10, tipo="Fast"):
+    with _gas_lock:
+        ent = _gas_cache.get(tipo)
+        if ent is not None and monotonic() - ent[0] < GAS_PRICE_TTL_SECONDS:
+            return ent[1]
+        evento = _gas_em_curso.get(tipo)
+        renovar = evento is None
+        if renovar:
+            evento = _gas_em_curso[tipo] = threading.Event()
+        elif ent is not None:
+            # Outra thread já está a renovar: o último valor serve até chegar o novo
+            return ent[1]
+    if not renovar:
+        evento.wait()
+        ent = _gas_cache.get(tipo)
+        if ent is not None:
+            return ent[1]
+        # A consulta da outra thread falhou: tentar diretamente (propaga o erro, se houver)
+        return _consultar_taxa_gas(web3_instance, logger, retries, delay, timeout, tipo)
+    try:
+        taxa = _consultar_taxa_gas(web3_instance, logger, retries, delay, timeout, tipo)
+        with _gas_lock:
+            _gas_cache[tipo] = (monotonic(), taxa)
+        return taxa
+    finally:
+        with _gas_lock:
+            _gas_em_curso.pop(tipo, None)
+        evento.set()
+
+def taxa_gas_expirada(tipo="Fast") -> bool:
+    """True se a próxima obter_taxa_gas(tipo) teria de consultar a fonte (cache vazio ou fora do TTL).
+    False enquanto outra thread já renova a taxa (single-flight): não vale a pena uma consulta paralela."""
+    with _gas_lock:
+        if tipo in _gas_em_curso:
+            return False
+        ent = _gas_cache.get(tipo)
+    return ent is None or monotonic() - ent[0] >= GAS_PRICE_TTL_SECONDS
+
+def registar_taxa_gas(taxa_gwei: float, tipo="Fast") -> None:
+    """Guarda no cache uma taxa (gwei) obtida por outra via, ex.: num lote JSON-RPC partilhado."""
+    with _gas_lock:
+        _gas_cache[tipo] = (monotonic(), float(taxa_gwei))
+
+def _consultar_taxa_gas(web3_instance, logger, retries, delay, timeout, tipo):
     api_key = os.getenv("POLYGONSCAN_API_KEY")
     url = f"https://api.polygonscan.com/api?module=gastracker&action=gasoracle&apikey={api_key}"
 
@@ -13,7 +72,7 @@ def obter_taxa_gas(web3_instance, logger, retries=3, delay=2, timeout=10, tipo="
         for attempt in range(retries):
             try:
                 logger.info(f"Tentativa {attempt + 1} de {retries} para obter a taxa de gás da API Polygonscan...")
-                response = requests.get(url, timeout=timeout)
+                response = _SESSION.get(url, timeout=timeout)
                 response.raise_for_status()
                 data = response.json()
 
@@ -1,40 +1,149 @@
 import os
 import sys
-from web3 import Web3
-from typing import Tuple, List
+import requests
+from typing import Iterator, Tuple, List
 
 # Configuração de diretório base e importações
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(base_dir)
 
-from utils.config import config, logger
-from utils.rpc_utils import record_fail
+from utils.config import config, logger, obter_checksum, enviar_lote_rpc, V2_MAX_HOPS
+from utils.rpc_utils import record_fail, cached_block_number
+from utils.multicall_utils import aggregate3, seletor
+from eth_abi.abi import encode, decode
+from eth_abi.exceptions import DecodingError
+from web3.exceptions import BadFunctionCallOutput, ContractLogicError
 import time
+import threading
+from functools import lru_cache
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 
-# Cache TTL simples para evitar chamadas repetidas no mesmo ciclo
+# Cache TTL simples para evitar chamadas repetidas no mesmo ciclo. Guarda (expira_em, valor) no relógio
+# monotónico (imune a ajustes de NTP). Limitado a QUOTE_CACHE_MAX entradas: o dict mantém ordem de inserção, pelo que as mais antigas saem primeiro.
 _quote_cache: dict[tuple, tuple[float, int]] = {}
 _CACHE_TTL_SEC = float(os.getenv("QUOTE_CACHE_TTL_SEC", "2"))
+_CACHE_MAX = max(1, int(os.getenv("QUOTE_CACHE_MAX", "50000")))
+_CACHE_FOLGA = max(1, _CACHE_MAX // 10)
+
+# Camada por bloco: as reservas só mudam entre blocos, pelo que um novo bloco invalida todo o cache.
+# O número do bloco é consultado no máximo a cada QUOTE_BLOCK_POLL_SEC (0 desativa a camada).
+_BLOCO_POLL_SEC = float(os.getenv("QUOTE_BLOCK_POLL_SEC", "0.5"))
+_bloco_atual = {'num': -1, 'verificar_em': 0.0}
+_bloco_lock = threading.Lock()
+
+def _verificar_bloco():
+    """Atualiza o bloco corrente (no máximo a cada _BLOCO_POLL_SEC) e limpa o cache se avançou."""
+    agora = time.monotonic()
+    if _BLOCO_POLL_SEC <= 0 or agora < _bloco_atual['verificar_em']:
+        return
+    with _bloco_lock:
+        if agora < _bloco_atual['verificar_em']:
+            return
+        _bloco_atual['verificar_em'] = agora + _BLOCO_POLL_SEC
+        try:
+            numero = cached_block_number()
+        except Exception:
+            return
+        if numero != _bloco_atual['num']:
+            _bloco_atual['num'] = numero
+            _quote_cache.clear()
 
 def _cache_get(key: tuple) -> int | None:
+    _verificar_bloco()
     ent = _quote_cache.get(key)
     if not ent:
         return None
-    ts, val = ent
-    if time.time() - ts > _CACHE_TTL_SEC:
+    expira_em, val = ent
+    if time.monotonic() > expira_em:
         return None
     return val
 
 def _cache_set(key: tuple, value: int):
-    _quote_cache[key] = (time.time(), value)
-
-# Variáveis principais do módulo
-web3 = config['web3']
+    if len(_quote_cache) >= _CACHE_MAX and key not in _quote_cache:
+        _podar_cache()
+    _quote_cache[key] = (time.monotonic() + _CACHE_TTL_SEC, value)
+
+def _podar_cache():
+    """Remove entradas expiradas; se o cache continuar cheio, descarta as mais antigas.
+    Liberta sempre pelo menos 10% da capacidade, para que a varredura completa (O(N)) só aconteça
+    uma vez a cada ~_CACHE_MAX/10 inserções e não a cada inserção com o cache cheio.
+    Itera sobre uma cópia (list() é atómico sob o GIL) porque outros workers escrevem em paralelo."""
+    agora = time.monotonic()
+    entradas = list(_quote_cache.items())
+    for k, (expira_em, _) in entradas:
+        if expira_em < agora:
+            _quote_cache.pop(k, None)
+    excesso = len(_quote_cache) - _CACHE_MAX + _CACHE_FOLGA
+    if excesso > 0:
+        for k in list(islice(_quote_cache, excesso)):
+            _quote_cache.pop(k, None)
+
+# Revert (sem pool/liquidez) ou retorno vazio: resultado esperado de uma cotação, não uma falha de RPC.
+# Só as restantes exceções (transporte) contam para o failover via record_fail.
+_REVERTS = (ContractLogicError, BadFunctionCallOutput, DecodingError)
+
+# Pool para cotações individuais concorrentes quando não há lote (Multicall/JSON-RPC) disponível
+_RPC_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("QUOTE_RPC_WORKERS", "8")), thread_name_prefix="quote-rpc")
+
+# Variáveis principais do módulo. A instância Web3 não é capturada aqui: é lida de
+# config['web3'] a cada chamada, para que o hot-switch de RPC (rpc_utils) chegue às cotações.
 TOKENS = config['TOKENS']
 # Endereço nulo para verificar se um pool existe
 ADDRESS_ZERO = "0x0000000000000000000000000000000000000000"
 
+def _resolver_hubs() -> tuple[str, ...]:
+    hubs = []
+    for key in ['wmatic', 'weth', 'usdt', 'dai']:
+        try:
+            hubs.append(obter_checksum(TOKENS[key]['address']))
+        except Exception:
+            continue
+    return tuple(hubs)
+
+# Hubs de roteamento (WMATIC/WETH/USDT/DAI) em checksum, resolvidos uma vez: os tokens são estáticos
+_HUBS = _resolver_hubs()
+
+def _eth_call(transacao: dict) -> bytes:
+    """eth_call avulso no provider ativo (config['web3'] lido no momento da chamada)."""
+    return config['web3'].eth.call(transacao)
+
+def _chamar_em_lote(chamadas: List[tuple[str, bytes]]) -> List[tuple[bool, bytes]]:
+    """
+    Executa várias leituras (alvo, calldata) e devolve [(sucesso, retorno), ...] na mesma ordem.
+    Preferência: um único aggregate3 do Multicall3; se estiver desativado (USE_MULTICALL3=0) ou
+    falhar, um lote JSON-RPC de eth_call num só POST. Se ambos falharem, a exceção propaga-se
+    e o chamador recorre às chamadas individuais.
+
+    A classificação das falhas é feita só aqui: Multicall3 ausente ou retorno que não descodifica
+    (_REVERTS) e nó sem suporte a lotes (ValueError) não são falhas do provider; uma falha de
+    transporte conta uma única vez em record_fail. Os chamadores não voltam a contá-la.
+    """
+    falha_transporte = False
+    if config.get('use_multicall3', True):
+        try:
+            return aggregate3(config['web3'], chamadas)
+        except _REVERTS:
+            pass
+        except Exception:
+            falha_transporte = True
+    try:
+        resultados = enviar_lote_rpc(config['web3'], [
+            ("eth_call", [{"to": alvo, "data": "0x" + dados.hex()}, "latest"]) for alvo, dados in chamadas
+        ])
+    except Exception as e:
+        if falha_transporte or isinstance(e, requests.RequestException):
+            record_fail()
+        raise
+    return [(r is not None, bytes.fromhex(r[2:]) if r else b"") for r in resultados]
+
 # --- Helpers para Uniswap V3 multi-hop ---
 # O path V3 codifica sequências de (token, fee, token, fee, ..., token)
+@lru_cache(maxsize=1024)
+def _endereco_em_bytes(endereco: str) -> bytes:
+    """20 bytes de um endereço (checksum validado uma vez por endereço)."""
+    return bytes.fromhex(obter_checksum(endereco)[2:])
+
 def _encode_v3_path(tokens: List[str], fees: List[int]) -> bytes:
     """Codifica um caminho V3: tokens (N) e fees (N-1) para bytes conforme especificação Uniswap V3.
     tokens: lista de endereços (str)
@@ -44,55 +153,38 @@ def _encode_v3_path(tokens: List[str], fees: List[int]) -> bytes:
         raise ValueError("Path V3 requer pelo menos 2 tokens")
     if len(fees) != len(tokens) - 1:
         raise ValueError("fees deve ter N-1 elementos para N tokens")
-    # Cada token é 20 bytes; cada fee é 3 bytes (uint24 big-endian)
-    out = bytearray()
-    for i, t in enumerate(tokens):
-        # append token
-        t_bytes = bytes.fromhex(Web3.to_checksum_address(t)[2:])
-        out.extend(t_bytes)
-        if i < len(fees):
-            f = fees[i]
-            if f not in (100, 500, 3000, 10000):
-                # ainda permitir qualquer uint24, mas avisar
-                logger.debug(f"Fee V3 incomum no path: {f}")
-            out.extend(int(f).to_bytes(3, byteorder='big'))
+    # Cada token é 20 bytes; cada fee é 3 bytes (uint24 big-endian): buffer pré-alocado
+    out = bytearray(23 * len(tokens) - 3)
+    out[0:20] = _endereco_em_bytes(tokens[0])
+    off = 20
+    for f, t in zip(fees, tokens[1:]):
+        f = int(f)
+        if f not in (100, 500, 3000, 10000):
+            # ainda permitir qualquer uint24, mas avisar
+            logger.debug("Fee V3 incomum no path: %s", f)
+        out[off] = (f >> 16) & 0xFF
+        out[off + 1] = (f >> 8) & 0xFF
+        out[off + 2] = f & 0xFF
+        out[off + 3:off + 23] = _endereco_em_bytes(t)
+        off += 23
     return bytes(out)
 
-def quote_v3_multihop(token_in: str, token_out: str, amount_in: int, fee_choices: List[int] | None = None) -> tuple[int, List[str], List[int]]:
-    """Tenta cotar multi-hop no V3 usando hubs comuns (WMATIC/WETH/USDT/DAI) combinando fees.
-    Retorna (best_out, best_tokens, best_fees) onde fees tem len=N-1.
-    """
-    quoter = config['dex_contracts']['UniswapV3']['quoter']
-    token_in = Web3.to_checksum_address(token_in)
-    token_out = Web3.to_checksum_address(token_out)
-    hubs: List[str] = []
-    for key in ['wmatic', 'weth', 'usdt', 'dai']:
-        try:
-            hubs.append(Web3.to_checksum_address(TOKENS[key]['address']))
-        except Exception:
-            continue
-    from utils.config import config as _cfg
-    # Permitir configurar fee tiers via .env; fallback para parâmetros explícitos
-    try:
-        fees_all = fee_choices or _cfg.get('V3_FEE_CHOICES', [500, 3000])
-    except Exception:
-        fees_all = fee_choices or [500, 3000]
-    try:
-        max_hops = int(_cfg.get('V3_MAX_HOPS', 1))
-    except Exception:
-        max_hops = 1
-
-    candidates: List[tuple[List[str], List[int]]] = []
+@lru_cache(maxsize=512)
+def _candidatos_v3(token_in: str, token_out: str, max_hops: int, fees_all: tuple[int, ...]) -> tuple[tuple[tuple[str, ...], tuple[int, ...], bytes], ...]:
+    """Caminhos V3 candidatos (tokens, fees, path codificado) para o par: enumerados e codificados uma
+    única vez por (par, max_hops, fees), já que tokens e hubs são estáticos entre varreduras."""
+    hubs = _HUBS
+    candidates: List[tuple[tuple[str, ...], tuple[int, ...]]] = []
     # Direto (equivalente ao single-hop)
     for f in fees_all:
-        candidates.append(([token_in, token_out], [f]))
+        candidates.append(((token_in, token_out), (f,)))
     # 1-hop via hub
     for h in hubs:
         if h in (token_in, token_out):
             continue
         for f1 in fees_all:
             for f2 in fees_all:
-                candidates.append(([token_in, h, token_out], [f1, f2]))
+                candidates.append(((token_in, h, token_out), (f1, f2)))
     # 2-hops via dois hubs distintos (apenas se permitido)
     if max_hops >= 2:
         for i in range(len(hubs)):
@@ -105,30 +197,252 @@ def quote_v3_multihop(token_in: str, token_out: str, amount_in: int, fee_choices
                 for f1 in fees_all:
                     for f2 in fees_all:
                         for f3 in fees_all:
-                            candidates.append(([token_in, h1, h2, token_out], [f1, f2, f3]))
+                            candidates.append(((token_in, h1, h2, token_out), (f1, f2, f3)))
 
-    best_out = 0
-    best_tokens: List[str] = []
-    best_fees: List[int] = []
+    # limitar path a (max_hops + 2) tokens: exemplo, max_hops=1 permite [in, hub, out] (3 tokens)
+    avaliaveis = []
     for toks, fees in candidates:
-        # limitar path a (max_hops + 2) tokens: exemplo, max_hops=1 permite [in, hub, out] (3 tokens)
         if len(toks) > (max_hops + 2):
             continue
         try:
-            path_bytes = _encode_v3_path(toks, fees)
-            out = quoter.functions.quoteExactInput(path_bytes, amount_in).call()
-            if out > best_out:
-                best_out = out
-                best_tokens = toks
-                best_fees = fees
-        except Exception:
+            avaliaveis.append((toks, fees, _encode_v3_path(toks, fees)))
+        except ValueError:
             continue
+    return tuple(avaliaveis)
+
+# Existência de pools V3 por (tokenA, tokenB, fee) com tokens ordenados. Um pool criado nunca
+# desaparece (entrada permanente); a ausência é reavaliada após V3_FEE_CACHE_TTL_SEC.
+_pools_v3_existentes: dict[tuple[str, str, int], tuple[bool, float]] = {}
+
+def _chave_pool_v3(a: str, b: str, fee: int) -> tuple[str, str, int]:
+    return (a, b, fee) if a.lower() < b.lower() else (b, a, fee)
+
+def _filtrar_por_pools_v3(avaliaveis):
+    """
+    Mantém só os caminhos cujos saltos têm todos pool na factory V3. Os saltos ainda
+    desconhecidos são sondados com getPool num único lote; se a sonda falhar, não filtra.
+    """
+    agora = time.monotonic()
+    desconhecidos = set()
+    for toks, fees, _ in avaliaveis:
+        for i, fee in enumerate(fees):
+            chave = _chave_pool_v3(toks[i], toks[i + 1], fee)
+            ent = _pools_v3_existentes.get(chave)
+            if ent is None or (not ent[0] and agora - ent[1] > V3_FEE_CACHE_TTL_SEC):
+                desconhecidos.add(chave)
+    if desconhecidos:
+        factory_address = config['uniswap_v3_factory_address']
+        chaves = list(desconhecidos)
+        try:
+            respostas = _chamar_em_lote([
+                (factory_address, _GET_POOL_SELECTOR + encode(['address', 'address', 'uint24'], list(chave)))
+                for chave in chaves
+            ])
+        except Exception:
+            return avaliaveis
+        for chave, (sucesso, dados) in zip(chaves, respostas):
+            if sucesso and len(dados) >= 32:
+                _pools_v3_existentes[chave] = (_uint256(dados) != 0, agora)
+
+    def _existe(chave) -> bool:
+        ent = _pools_v3_existentes.get(chave)
+        return ent is None or ent[0]  # sem resposta da sonda: não descartar
+
+    return tuple(
+        (toks, fees, path_bytes) for toks, fees, path_bytes in avaliaveis
+        if all(_existe(_chave_pool_v3(toks[i], toks[i + 1], fee)) for i, fee in enumerate(fees))
+    )
+
+def quote_v3_multihop(token_in: str, token_out: str, amount_in: int, fee_choices: List[int] | None = None) -> tuple[int, List[str], List[int]]:
+    """Tenta cotar multi-hop no V3 usando hubs comuns (WMATIC/WETH/USDT/DAI) combinando fees.
+    Retorna (best_out, best_tokens, best_fees) onde fees tem len=N-1.
+    """
+    quoter_address = config['dex_contracts']['UniswapV3']['quoter'].address
+    token_in = obter_checksum(token_in)
+    token_out = obter_checksum(token_out)
+    # Permitir configurar fee tiers via .env; fallback para parâmetros explícitos
+    try:
+        fees_all = fee_choices or config.get('V3_FEE_CHOICES', [500, 3000])
+    except Exception:
+        fees_all = fee_choices or [500, 3000]
+    try:
+        max_hops = int(config.get('V3_MAX_HOPS', 1))
+    except Exception:
+        max_hops = 1
+
+    avaliaveis = _filtrar_por_pools_v3(_candidatos_v3(token_in, token_out, max_hops, tuple(fees_all)))
+    if not avaliaveis:
+        return 0, [], []
+
+    # Todos os caminhos candidatos num único aggregate3 (falhas por pool inexistente são ignoradas)
+    outs: List[int] = []
+    try:
+        respostas = _chamar_em_lote([
+            (quoter_address, _calldata_quote_multi(path_bytes, amount_in)) for _, _, path_bytes in avaliaveis
+        ])
+        outs = [_uint256(dados) if sucesso else 0 for sucesso, dados in respostas]
+    except Exception:
+        # Sem lote disponível: as cotações individuais correm em paralelo (latência ~max(RTT))
+        def _cotar_caminho(path_bytes: bytes) -> int:
+            try:
+                return _uint256(_eth_call({'to': quoter_address, 'data': _calldata_quote_multi(path_bytes, amount_in)}))
+            except _REVERTS:
+                return 0
+            except Exception:
+                record_fail()
+                return 0
+        outs = list(_RPC_POOL.map(_cotar_caminho, [path_bytes for _, _, path_bytes in avaliaveis]))
+
+    best_out = 0
+    best_tokens: List[str] = []
+    best_fees: List[int] = []
+    for (toks, fees, _), out in zip(avaliaveis, outs):
+        if out > best_out:
+            best_out = out
+            best_tokens = list(toks)
+            best_fees = list(fees)
     return best_out, best_tokens, best_fees
 
 # Expor função pública para consumo externo
 def encode_v3_path(tokens: List[str], fees: List[int]) -> bytes:
     return _encode_v3_path(tokens, fees)
 
+# --- Cotação V3 single-hop em lote (todos os fee tiers num único eth_call via Multicall3) ---
+V3_FEE_TIERS = [100, 500, 3000, 10000]
+_QUOTE_SINGLE_SELECTOR = seletor("quoteExactInputSingle(address,address,uint24,uint256,uint160)")
+_GET_AMOUNTS_OUT_SELECTOR = seletor("getAmountsOut(uint256,address[])")
+_GET_RESERVES_SELECTOR = seletor("getReserves()")
+_GET_PAIR_SELECTOR = seletor("getPair(address,address)")
+_GET_POOL_SELECTOR = seletor("getPool(address,address,uint24)")
+_QUOTE_MULTI_SELECTOR = seletor("quoteExactInput(bytes,uint256)")
+
+# Calldata das cotações montada diretamente (seletor pré-calculado + eth_abi), sem a camada
+# de validação/codificação de contract.functions; partilhada pelo Multicall e pelo eth_call avulso.
+# Por (par, fee) ou caminho, só o amountIn varia: a calldata é codificada uma vez como modelo
+# (amountIn = 0) e cada cotação apenas substitui essa palavra de 32 bytes, sem eth_abi.
+@lru_cache(maxsize=4096)
+def _modelo_quote_single(token_in: str, token_out: str, fee: int) -> bytes:
+    return _QUOTE_SINGLE_SELECTOR + encode(
+        ['address', 'address', 'uint24', 'uint256', 'uint160'], [token_in, token_out, fee, 0, 0]
+    )
+
+@lru_cache(maxsize=4096)
+def _modelo_quote_multi(path_bytes: bytes) -> bytes:
+    return _QUOTE_MULTI_SELECTOR + encode(['bytes', 'uint256'], [path_bytes, 0])
+
+@lru_cache(maxsize=4096)
+def _modelo_get_amounts_out(path: tuple[str, ...]) -> bytes:
+    return _GET_AMOUNTS_OUT_SELECTOR + encode(['uint256', 'address[]'], [0, list(path)])
+
+def _calldata_quote_single(token_in: str, token_out: str, fee: int, quantidade_base_in: int) -> bytes:
+    modelo = _modelo_quote_single(token_in, token_out, fee)
+    # amountIn é a 4.ª palavra dos argumentos (bytes 100..132)
+    return modelo[:100] + quantidade_base_in.to_bytes(32, 'big') + modelo[132:]
+
+def _calldata_quote_multi(path_bytes: bytes, quantidade_base_in: int) -> bytes:
+    modelo = _modelo_quote_multi(path_bytes)
+    # amountIn é a 2.ª palavra (a 1.ª é o offset do path dinâmico)
+    return modelo[:36] + quantidade_base_in.to_bytes(32, 'big') + modelo[68:]
+
+def _uint256(retorno: bytes) -> int:
+    """Primeira palavra de 32 bytes do retorno como uint256 (0 se o retorno vier vazio/curto)."""
+    return int.from_bytes(retorno[:32], 'big') if len(retorno) >= 32 else 0
+
+def _calldata_get_amounts_out(quantidade_base_in: int, path: List[str]) -> bytes:
+    # amountIn é a 1.ª palavra; o resto (offset + path) vem do modelo do caminho
+    return _GET_AMOUNTS_OUT_SELECTOR + quantidade_base_in.to_bytes(32, 'big') + _modelo_get_amounts_out(tuple(path))[36:]
+
+# Expor função pública para consumo externo (ex.: lotes JSON-RPC montados noutros módulos)
+def calldata_get_amounts_out(quantidade_base_in: int, path: List[str]) -> bytes:
+    return _calldata_get_amounts_out(quantidade_base_in, path)
+
+def _get_amounts_out_raw(router_address: str, quantidade_base_in: int, path: List[str]) -> List[int]:
+    retorno = _eth_call({'to': router_address, 'data': _calldata_get_amounts_out(quantidade_base_in, path)})
+    return list(decode(['uint256[]'], retorno)[0])
+
+def _cotar_v3_single_sequencial(quoter_address: str, token_in: str, token_out: str, fee: int, quantidade_base_in: int) -> int:
+    # Reenvios por falha de transporte ficam a cargo da sessão HTTP (urllib3 Retry); um revert não se repete
+    try:
+        return _uint256(_eth_call({'to': quoter_address, 'data': _calldata_quote_single(token_in, token_out, fee, quantidade_base_in)}))
+    except _REVERTS:
+        return 0
+    except Exception:
+        record_fail()
+        return 0
+
+def cotar_v3_single_por_fee(token_in: str, token_out: str, quantidade_base_in: int, fees: List[int] | None = None) -> dict[int, int]:
+    """
+    Cota quoteExactInputSingle para vários fee tiers e devolve {fee: amountOut} (0 se o pool não existir).
+    Os tiers fora do cache seguem num único aggregate3; se o Multicall falhar, cai para chamadas individuais.
+    """
+    fees = fees or V3_FEE_TIERS
+    resultado: dict[int, int] = {}
+    pendentes: List[int] = []
+    for fee in fees:
+        cached = _cache_get(("v3_single", token_in, token_out, fee, quantidade_base_in))
+        if cached is not None:
+            resultado[fee] = cached
+        else:
+            pendentes.append(fee)
+    if not pendentes:
+        return resultado
+
+    quoter_contract = config['dex_contracts']['UniswapV3']['quoter']
+    try:
+        chamadas = [
+            (quoter_contract.address, _calldata_quote_single(token_in, token_out, fee, quantidade_base_in))
+            for fee in pendentes
+        ]
+        respostas = _chamar_em_lote(chamadas)
+        novos = {
+            fee: (_uint256(dados) if sucesso else 0)
+            for fee, (sucesso, dados) in zip(pendentes, respostas)
+        }
+    except Exception:
+        novos = {fee: _cotar_v3_single_sequencial(quoter_contract.address, token_in, token_out, fee, quantidade_base_in) for fee in pendentes}
+
+    for fee, out in novos.items():
+        if out:
+            _cache_set(("v3_single", token_in, token_out, fee, quantidade_base_in), out)
+        resultado[fee] = out
+    _registar_melhor_fee(token_in, token_out, resultado)
+    return resultado
+
+# Melhor fee tier V3 por par (token_in, token_out), aprendido nas próprias cotações e
+# reutilizado durante V3_FEE_CACHE_TTL_SEC (o pool mais profundo muda raramente).
+V3_FEE_CACHE_TTL_SEC = float(os.getenv("V3_FEE_CACHE_TTL_SEC", "3600"))
+_melhor_fee_cache: dict[tuple[str, str], tuple[float, int]] = {}
+
+def _registar_melhor_fee(token_in: str, token_out: str, cotacoes: dict[int, int]) -> None:
+    fee, out = max(cotacoes.items(), key=lambda item: item[1], default=(None, 0))
+    if out > 0:
+        _melhor_fee_cache[(token_in, token_out)] = (time.monotonic(), fee)
+
+def obter_melhor_fee_v3(token_in_address: str, token_out_address: str, quantidade_base_in: int) -> int:
+    """Fee tier com melhor saída para o par; sonda todos os tiers (1 Multicall) só quando o cache expira."""
+    token_in = obter_checksum(token_in_address)
+    token_out = obter_checksum(token_out_address)
+    ent = _melhor_fee_cache.get((token_in, token_out))
+    if ent is None or time.monotonic() - ent[0] > V3_FEE_CACHE_TTL_SEC:
+        cotar_v3_single_por_fee(token_in, token_out, quantidade_base_in)
+        ent = _melhor_fee_cache.get((token_in, token_out))
+    return ent[1] if ent else 3000
+
+# Endereços de pares V2 são constantes on-chain (CREATE2): memorizados por (dex, par ordenado).
+# Apenas pares existentes entram no cache; um par inexistente pode ainda vir a ser criado.
+_pares_v2_cache: dict[tuple[str, str, str], str] = {}
+
+def _resolver_par_v2(dex_nome: str, factory_address: str, a: str, b: str) -> str:
+    """Endereço do par V2 para tokens já em checksum (getPair por eth_call cru, memorizado)."""
+    chave = (dex_nome, a, b) if a < b else (dex_nome, b, a)
+    pool_address = _pares_v2_cache.get(chave)
+    if pool_address is None:
+        retorno = _eth_call({'to': factory_address, 'data': _GET_PAIR_SELECTOR + encode(['address', 'address'], [a, b])})
+        pool_address = obter_checksum('0x' + retorno[12:32].hex())
+        if pool_address != ADDRESS_ZERO:
+            _pares_v2_cache[chave] = pool_address
+    return pool_address
+
 # --- NOVA FUNCIONALIDADE (Tarefa 1.1) ---
 def obter_reservas_pool_v2(dex_nome: str, token_a_address: str, token_b_address: str) -> Tuple[int, int] | None:
     """
@@ -144,111 +458,92 @@ def obter_reservas_pool_v2(dex_nome: str, token_a_address: str, token_b_address:
         As reservas são retornadas na mesma ordem dos tokens de entrada.
     """
     try:
-        dex_info = config['dex_contracts'][dex_nome]
-        factory_contract = dex_info['factory']
-        
-        # 1. Encontrar o endereço do pool de liquidez
-        pool_address = factory_contract.functions.getPair(token_a_address, token_b_address).call()
+        factory_address = config['dex_contracts'][dex_nome]['factory'].address
+        # Checksum uma única vez (memoizado) e reutilizado em todo o caminho
+        token_a, token_b = obter_checksum(token_a_address), obter_checksum(token_b_address)
+
+        # 1. Encontrar o endereço do pool de liquidez (memorizado após a primeira consulta)
+        pool_address = _resolver_par_v2(dex_nome, factory_address, token_a, token_b)
 
         if pool_address == ADDRESS_ZERO:
-            logger.debug(f"Pool para {token_a_address[-6:]}/{token_b_address[-6:]} não encontrado em {dex_nome}.")
+            logger.debug("Pool para %s/%s não encontrado em %s.", token_a[-6:], token_b[-6:], dex_nome)
             return None
 
-        # 2. Interagir com o contrato do pool para obter as reservas
-        # CORREÇÃO: Obter o nome do ABI do Pair diretamente da configuração
-        pair_abi_nome = dex_info['pair_abi_name']
-        # CORREÇÃO: Usar a função de carregar ABI exposta pelo config
-        pair_abi = config['carregar_abi_localmente'](pair_abi_nome)
-        
-        pool_contract = web3.eth.contract(address=pool_address, abi=pair_abi)
-        
-        token0_address = pool_contract.functions.token0().call()
-        (reserve0, reserve1, _) = pool_contract.functions.getReserves().call()
-
-        # 3. Retornar as reservas na ordem correta
-        if Web3.to_checksum_address(token_a_address) == token0_address:
+        # 2. Ler as reservas com um único eth_call cru. token0() é dispensável: a factory V2
+        # ordena sempre o par por endereço (token0 < token1), pelo que a ordem é conhecida.
+        retorno = _eth_call({'to': pool_address, 'data': _GET_RESERVES_SELECTOR})
+        if len(retorno) < 64:
+            return None
+        reserve0, reserve1 = int.from_bytes(retorno[0:32], 'big'), int.from_bytes(retorno[32:64], 'big')
+
+        # 3. Retornar as reservas na ordem dos tokens de entrada
+        if token_a.lower() < token_b.lower():
             return (reserve0, reserve1)
         else:
             return (reserve1, reserve0)
 
     except Exception as e:
-        logger.error(f"Erro ao obter reservas do pool em {dex_nome}: {e}")
+        logger.error("Erro ao obter reservas do pool em %s: %s", dex_nome, e)
         return None
 
 
-def obter_preco_saida(dex_nome: str, token_in_address: str, token_out_address: str, quantidade_base_in: int) -> int:
+def _cotar_saida_e_fee(dex_nome: str, token_in_address: str, token_out_address: str, quantidade_base_in: int) -> tuple[int, int]:
     """
-    Obtém a quantidade de saída para uma troca, lidando com diferentes DEXs.
+    Implementação comum de obter_preco_saida e obter_preco_saida_e_fee: uma única passagem
+    (e as mesmas entradas de cache) devolve (amountOut, fee). Para V2, fee é 0.
     """
     try:
-        token_in = Web3.to_checksum_address(token_in_address)
-        token_out = Web3.to_checksum_address(token_out_address)
+        token_in = obter_checksum(token_in_address)
+        token_out = obter_checksum(token_out_address)
 
         # Lógica para Roteadores V3 (Uniswap V3)
         if dex_nome == "UniswapV3":
-            quoter_contract = config['dex_contracts']['UniswapV3']['quoter']
             # Considerar múltiplos fee tiers e escolher o maior retorno disponível
-            fees = [100, 500, 3000, 10000]
+            cotacoes = cotar_v3_single_por_fee(token_in, token_out, quantidade_base_in)
             melhor = 0
-            for fee in fees:
-                try:
-                    cache_key = ("v3_single", token_in, token_out, fee, quantidade_base_in)
-                    cached = _cache_get(cache_key)
-                    if cached is not None:
-                        out = cached
-                    else:
-                        # retries leves
-                        out = 0
-                        for _ in range(2):
-                            try:
-                                out = quoter_contract.functions.quoteExactInputSingle(
-                                    token_in, token_out, fee, quantidade_base_in, 0
-                                ).call()
-                                break
-                            except Exception:
-                                record_fail()
-                                time.sleep(0.1)
-                        if out:
-                            _cache_set(cache_key, out)
-                    if out > melhor:
-                        melhor = out
-                except Exception as e:
-                    # Ignorar erros de pools inexistentes neste fee tier
-                    continue
-            return melhor
+            melhor_fee = 3000
+            for fee, out in cotacoes.items():
+                if out > melhor:
+                    melhor = out
+                    melhor_fee = fee
+            return melhor, melhor_fee
 
         # Lógica para Roteadores V2 (Sushiswap, Quickswap)
         elif dex_nome in ["SushiSwapV2", "QuickSwapV2"]:
-            router_contract = config['dex_contracts'][dex_nome]['router']
+            router_address = config['dex_contracts'][dex_nome]['router'].address
             path = [token_in, token_out]
             cache_key = ("v2_path", tuple(path), quantidade_base_in)
             cached = _cache_get(cache_key)
             if cached is not None:
-                amounts_out_1 = cached
-            else:
-                amounts_out_1 = 0
-                for _ in range(2):
-                    try:
-                        amounts_out = router_contract.functions.getAmountsOut(quantidade_base_in, path).call()
-                        amounts_out_1 = amounts_out[1]
-                        break
-                    except Exception:
-                        record_fail()
-                        time.sleep(0.1)
-                if amounts_out_1:
-                    _cache_set(cache_key, amounts_out_1)
-            return amounts_out_1
+                return cached, 0
+            try:
+                outv = _get_amounts_out_raw(router_address, quantidade_base_in, path)[1]
+            except _REVERTS:
+                outv = 0
+            except Exception:
+                record_fail()
+                outv = 0
+            if outv:
+                _cache_set(cache_key, outv)
+            return outv, 0
 
         else:
-            logger.warning(f"DEX '{dex_nome}' não suportada pela função obter_preco_saida.")
-            return 0
+            logger.warning("DEX '%s' não suportada pela função obter_preco_saida.", dex_nome)
+            return 0, 0
 
     except Exception as e:
         if 'insufficient liquidity' in str(e).lower():
-            logger.debug(f"Liquidez insuficiente para {token_in[-4:]}->{token_out[-4:]} em {dex_nome}.")
+            logger.debug("Liquidez insuficiente para %s->%s em %s.", token_in_address[-4:], token_out_address[-4:], dex_nome)
         else:
-            logger.error(f"Erro ao obter preço de saída em {dex_nome}: {e}")
-        return 0
+            logger.error("Erro ao obter preço de saída em %s: %s", dex_nome, e)
+        return 0, 0
+
+
+def obter_preco_saida(dex_nome: str, token_in_address: str, token_out_address: str, quantidade_base_in: int) -> int:
+    """
+    Obtém a quantidade de saída para uma troca, lidando com diferentes DEXs.
+    """
+    return _cotar_saida_e_fee(dex_nome, token_in_address, token_out_address, quantidade_base_in)[0]
 
 
 def obter_preco_saida_e_fee(dex_nome: str, token_in_address: str, token_out_address: str, quantidade_base_in: int) -> tuple[int, int]:
@@ -256,164 +551,168 @@ def obter_preco_saida_e_fee(dex_nome: str, token_in_address: str, token_out_addr
     Versão que também retorna o fee escolhido quando a DEX é Uniswap V3.
     Para V2, retorna (amountOut, 0).
     """
-    try:
-        token_in = Web3.to_checksum_address(token_in_address)
-        token_out = Web3.to_checksum_address(token_out_address)
+    return _cotar_saida_e_fee(dex_nome, token_in_address, token_out_address, quantidade_base_in)
 
-        if dex_nome == "UniswapV3":
-            quoter_contract = config['dex_contracts']['UniswapV3']['quoter']
-            fees = [100, 500, 3000, 10000]
-            melhor = 0
-            melhor_fee = 3000
-            for fee in fees:
-                try:
-                    cache_key = ("v3_single_fee", token_in, token_out, fee, quantidade_base_in)
-                    cached = _cache_get(cache_key)
-                    if cached is not None:
-                        out = cached
-                    else:
-                        out = 0
-                        for _ in range(2):
-                            try:
-                                out = quoter_contract.functions.quoteExactInputSingle(
-                                    token_in, token_out, fee, quantidade_base_in, 0
-                                ).call()
-                                break
-                            except Exception:
-                                record_fail()
-                                time.sleep(0.1)
-                        if out:
-                            _cache_set(cache_key, out)
-                    if out > melhor:
-                        melhor = out
-                        melhor_fee = fee
-                except Exception:
+
+def _gerar_caminhos_v2(token_in: str, token_out: str) -> Iterator[tuple[str, ...]]:
+    """Produz os caminhos V2 únicos (no máximo 4 nós) à medida que são gerados, sem lista intermédia."""
+    # Sempre considerar o direto
+    yield (token_in, token_out)
+
+    hubs = _HUBS
+
+    # 1 intermediário
+    for h in hubs:
+        if h != token_in and h != token_out:
+            yield (token_in, h, token_out)
+
+    # 2 intermediários (ordem importa; limitar combinações) — controlado via V2_MAX_HOPS
+    if V2_MAX_HOPS >= 2:
+        for h1 in hubs:
+            for h2 in hubs:
+                if h1 == h2 or h1 in (token_in, token_out) or h2 in (token_in, token_out):
                     continue
-            return melhor, melhor_fee
-        elif dex_nome in ["SushiSwapV2", "QuickSwapV2"]:
-            router_contract = config['dex_contracts'][dex_nome]['router']
-            path = [token_in, token_out]
-            cache_key = ("v2_path_fee", tuple(path), quantidade_base_in)
-            cached = _cache_get(cache_key)
-            if cached is not None:
-                outv = cached
-            else:
-                outv = 0
-                for _ in range(2):
-                    try:
-                        amounts_out = router_contract.functions.getAmountsOut(quantidade_base_in, path).call()
-                        outv = amounts_out[1]
-                        break
-                    except Exception:
-                        record_fail()
-                        time.sleep(0.1)
-                if outv:
-                    _cache_set(cache_key, outv)
-            return outv, 0
-        else:
-            logger.warning(f"DEX '{dex_nome}' não suportada pela função obter_preco_saida_e_fee.")
-            return 0, 0
-    except Exception as e:
-        if 'insufficient liquidity' in str(e).lower():
-            logger.debug(f"Liquidez insuficiente para {token_in[-4:]}->{token_out[-4:]} em {dex_nome} (com fee)")
-        else:
-            logger.error(f"Erro ao obter preço de saída/fee em {dex_nome}: {e}")
-        return 0, 0
+                yield (token_in, h1, h2, token_out)
 
 
-def _candidate_v2_paths(token_in: str, token_out: str) -> List[List[str]]:
+@lru_cache(maxsize=512)
+def _candidate_v2_paths(token_in: str, token_out: str) -> tuple[tuple[str, ...], ...]:
     """Gera caminhos candidatos para V2 (multi-hop):
     - Direto [in, out]
     - 1 hub: via WMATIC/WETH/USDT/DAI (se aplicável)
     - 2 hubs: combinações entre os hubs (ex: in->WMATIC->WETH->out)
 
     Limita o comprimento do path a 4 nós (3 swaps) para manter custo/risco sob controle.
+    Memoizado por par: os caminhos dependem apenas dos tokens e dos hubs (estáticos).
     """
-    token_in = Web3.to_checksum_address(token_in)
-    token_out = Web3.to_checksum_address(token_out)
-    paths: List[List[str]] = []
+    # Duplicados (ex.: token_in == token_out) descartados numa só passagem, mantendo a ordem
+    return tuple(dict.fromkeys(_gerar_caminhos_v2(obter_checksum(token_in), obter_checksum(token_out))))
 
-    # Sempre considerar o direto
-    paths.append([token_in, token_out])
 
-    hubs: List[str] = []
-    for key in ['wmatic', 'weth', 'usdt', 'dai']:
+def _cotar_lote_detalhado(sondas: List[tuple[str, str, str, int]]) -> List[tuple[int, object]]:
+    """
+    Cota várias sondas (dex, token_in, token_out, quantidade_base_in) num único aggregate3.
+    V2: testa todos os caminhos candidatos e devolve (melhorOut, melhorPath).
+    V3: testa todos os fee tiers single-hop e devolve (melhorOut, melhorFee).
+    Resultados já em cache não são reconsultados; os novos alimentam o cache.
+    """
+    quoter_contract = config['dex_contracts']['UniswapV3']['quoter']
+    melhores: List[list] = []
+    # Cada chamada pendente: (índice da sonda, chave de cache, detalhe, alvo, calldata, é_v2)
+    pendentes: List[tuple] = []
+    for idx, (dex_nome, token_in_address, token_out_address, quantidade) in enumerate(sondas):
+        token_in = obter_checksum(token_in_address)
+        token_out = obter_checksum(token_out_address)
+        if dex_nome == "UniswapV3":
+            melhores.append([0, 3000])
+            for fee in V3_FEE_TIERS:
+                chave = ("v3_single", token_in, token_out, fee, quantidade)
+                dados = _calldata_quote_single(token_in, token_out, fee, quantidade)
+                pendentes.append((idx, chave, fee, quoter_contract.address, dados, False))
+        elif dex_nome in ["SushiSwapV2", "QuickSwapV2"]:
+            melhores.append([0, []])
+            router_address = config['dex_contracts'][dex_nome]['router'].address
+            for path in _candidate_v2_paths(token_in, token_out):
+                chave = ("v2_best", path, quantidade)
+                dados = _calldata_get_amounts_out(quantidade, path)
+                pendentes.append((idx, chave, list(path), router_address, dados, True))
+        else:
+            melhores.append([0, None])
+
+    def _considerar(idx: int, out: int, detalhe):
+        if out > melhores[idx][0]:
+            melhores[idx][0] = out
+            melhores[idx][1] = detalhe
+
+    a_consultar = []
+    for item in pendentes:
+        cached = _cache_get(item[1])
+        if cached is not None:
+            _considerar(item[0], cached, item[2])
+        else:
+            a_consultar.append(item)
+
+    if a_consultar:
         try:
-            addr = Web3.to_checksum_address(TOKENS[key]['address'])
-            hubs.append(addr)
+            respostas = _chamar_em_lote([(alvo, dados) for _, _, _, alvo, dados, _ in a_consultar])
         except Exception:
-            continue
-
-    # 1 intermediário
-    for h in hubs:
-        if h != token_in and h != token_out:
-            paths.append([token_in, h, token_out])
-
-    # 2 intermediários (ordem importa; limitar combinações) — controlado via V2_MAX_HOPS
-    try:
-        from utils.config import V2_MAX_HOPS as _V2_MAX_HOPS
-    except Exception:
-        _V2_MAX_HOPS = 1
-    if _V2_MAX_HOPS >= 2:
-        for i in range(len(hubs)):
-            for j in range(len(hubs)):
-                if i == j:
+            respostas = None
+        if respostas is None:
+            # Multicall indisponível: uma cotação por sonda pelo caminho individual
+            for idx, (dex_nome, token_in_address, token_out_address, quantidade) in enumerate(sondas):
+                if dex_nome == "UniswapV3":
+                    # Direto às chamadas individuais: cotar_v3_single_por_fee repetiria o lote que já falhou
+                    token_in = obter_checksum(token_in_address)
+                    token_out = obter_checksum(token_out_address)
+                    for fee in V3_FEE_TIERS:
+                        out = _cotar_v3_single_sequencial(quoter_contract.address, token_in, token_out, fee, quantidade)
+                        if out:
+                            _cache_set(("v3_single", token_in, token_out, fee, quantidade), out)
+                        _considerar(idx, out, fee)
+                elif dex_nome in ["SushiSwapV2", "QuickSwapV2"]:
+                    out, path = _melhor_caminho_v2_sequencial(dex_nome, token_in_address, token_out_address, quantidade)
+                    _considerar(idx, out, path)
+        else:
+            for (idx, chave, detalhe, _, _, e_v2), (sucesso, retorno) in zip(a_consultar, respostas):
+                if not sucesso or len(retorno) < 32:
                     continue
-                h1 = hubs[i]
-                h2 = hubs[j]
-                if h1 in (token_in, token_out) or h2 in (token_in, token_out):
+                try:
+                    out = decode(['uint256[]'], retorno)[0][-1] if e_v2 else _uint256(retorno)
+                except (DecodingError, IndexError):
                     continue
-                # Evitar repetições tipo [h1,h2] e [h2,h1] sendo ambos incluídos em excesso
-                paths.append([token_in, h1, h2, token_out])
-
-    # Remover duplicados mantendo ordem e limitar a 4 nós
-    unique: List[List[str]] = []
-    seen = set()
-    for p in paths:
-        if len(p) < 2 or len(p) > 4:
+                if out:
+                    _cache_set(chave, out)
+                _considerar(idx, out, detalhe)
+
+    for (dex_nome, token_in_address, token_out_address, _), (out, fee) in zip(sondas, melhores):
+        if dex_nome == "UniswapV3" and out > 0:
+            _melhor_fee_cache[(obter_checksum(token_in_address), obter_checksum(token_out_address))] = (time.monotonic(), fee)
+    return [(out, detalhe) for out, detalhe in melhores]
+
+
+def cotar_lote(sondas: List[tuple[str, str, str, int]]) -> List[int]:
+    """Melhor amountOut de cada sonda (dex, token_in, token_out, quantidade_base_in), com 1 RTT para o lote."""
+    return [out for out, _ in _cotar_lote_detalhado(sondas)]
+
+
+def _melhor_caminho_v2_sequencial(dex_nome: str, token_in_address: str, token_out_address: str, quantidade_base_in: int) -> tuple[int, List[str]]:
+    router_address = config['dex_contracts'][dex_nome]['router'].address
+    best_out = 0
+    best_path: List[str] = []
+    for path in _candidate_v2_paths(obter_checksum(token_in_address), obter_checksum(token_out_address)):
+        path = list(path)
+        try:
+            cache_key = ("v2_best", tuple(path), quantidade_base_in)
+            cached = _cache_get(cache_key)
+            if cached is not None:
+                out = cached
+            else:
+                try:
+                    out = _get_amounts_out_raw(router_address, quantidade_base_in, path)[-1]
+                except _REVERTS:
+                    out = 0
+                except Exception:
+                    record_fail()
+                    out = 0
+                if out:
+                    _cache_set(cache_key, out)
+            if out > best_out:
+                best_out = out
+                best_path = path
+        except Exception:
             continue
-        key = tuple(p)
-        if key not in seen:
-            seen.add(key)
-            unique.append(p)
-    return unique
+    return best_out, best_path
 
 
 def obter_melhor_caminho_v2_e_quote(dex_nome: str, token_in_address: str, token_out_address: str, quantidade_base_in: int) -> tuple[int, List[str]]:
     """
     Para V2, testa caminhos candidatos (single-hop e multi-hop) e retorna (melhorAmountOut, melhorPath).
-    Para DEXs não V2, retorna (0, []).
+    Todos os caminhos seguem num único Multicall3. Para DEXs não V2, retorna (0, []).
     """
     try:
         if dex_nome not in ["SushiSwapV2", "QuickSwapV2"]:
             return 0, []
-        router_contract = config['dex_contracts'][dex_nome]['router']
-        best_out = 0
-        best_path: List[str] = []
-        for path in _candidate_v2_paths(token_in_address, token_out_address):
-            try:
-                cache_key = ("v2_best", tuple(path), quantidade_base_in)
-                cached = _cache_get(cache_key)
-                if cached is not None:
-                    out = cached
-                else:
-                    out = 0
-                    for _ in range(2):
-                        try:
-                            amounts = router_contract.functions.getAmountsOut(quantidade_base_in, path).call()
-                            out = amounts[-1]
-                            break
-                        except Exception:
-                            record_fail()
-                            time.sleep(0.1)
-                    if out:
-                        _cache_set(cache_key, out)
-                if out > best_out:
-                    best_out = out
-                    best_path = path
-            except Exception:
-                continue
-        return best_out, best_path
+        return _cotar_lote_detalhado([(dex_nome, token_in_address, token_out_address, quantidade_base_in)])[0]
     except Exception as e:
-        logger.error(f"Erro ao obter melhor caminho V2 em {dex_nome}: {e}")
+        logger.error("Erro ao obter melhor caminho V2 em %s: %s", dex_nome, e)
         return 0, []
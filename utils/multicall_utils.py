@@ -0,0 +1,53 @@
+"""
+Utilitários Multicall3.
+
+Agrega várias leituras (eth_call) numa única chamada RPC através do contrato
+Multicall3, implantado no mesmo endereço em todas as redes EVM (incl. Polygon).
+
+Funções:
+    obter_multicall(w3) -> Contract:
+        Contrato Multicall3 ligado à instância Web3 indicada (reutilizado por instância).
+    aggregate3(w3, chamadas, permitir_falha=True) -> list[tuple[bool, bytes]]:
+        Executa as chamadas (alvo, calldata) num único eth_call e devolve (sucesso, retorno).
+        Listas maiores que MULTICALL_BATCH_SIZE são divididas em vários eth_call (limite de gás do nó).
+    seletor(assinatura) -> bytes:
+        Seletor de 4 bytes de uma assinatura de função, ex.: "decimals()".
+"""
+import os
+from web3 import Web3
+
+from utils.abi_utils import carregar_abi
+
+MULTICALL3_ADDRESS_PADRAO = "0xcA11bde05977b3631167028862bE2a173976CA11"
+# Máximo de chamadas por eth_call: cotações consomem muito gás e os nós limitam o gás de eth_call
+MULTICALL_BATCH_SIZE = max(1, int(os.getenv("MULTICALL_BATCH_SIZE", "100")))
+
+# Um contrato por instância Web3 (após failover é recriado para o novo provider)
+_contratos_multicall = {}
+
+
+def obter_multicall(w3: Web3):
+    contrato = _contratos_multicall.get(id(w3))
+    if contrato is None or contrato.w3 is not w3:
+        endereco = Web3.to_checksum_address(os.getenv("MULTICALL3_ADDRESS", MULTICALL3_ADDRESS_PADRAO))
+        contrato = w3.eth.contract(address=endereco, abi=carregar_abi("Multicall3.json"))
+        _contratos_multicall[id(w3)] = contrato
+    return contrato
+
+
+def aggregate3(w3: Web3, chamadas: list[tuple[str, bytes]], permitir_falha: bool = True) -> list[tuple[bool, bytes]]:
+    """Executa [(alvo, calldata), ...] num único eth_call; a ordem do retorno segue a das chamadas."""
+    if not chamadas:
+        return []
+    calls = [(alvo, permitir_falha, dados) for alvo, dados in chamadas]
+    contrato = obter_multicall(w3)
+    if len(calls) <= MULTICALL_BATCH_SIZE:
+        return contrato.functions.aggregate3(calls).call()
+    resultados = []
+    for i in range(0, len(calls), MULTICALL_BATCH_SIZE):
+        resultados.extend(contrato.functions.aggregate3(calls[i:i + MULTICALL_BATCH_SIZE]).call())
+    return resultados
+
+
+def seletor(assinatura: str) -> bytes:
+    return bytes(Web3.keccak(text=assinatura)[:4])
@@ -7,11 +7,11 @@ Classes:
                   automática e manual com a rede.
 """
 import logging
+import threading
 from web3 import Web3
 # CORREÇÃO: Importar ChecksumAddress diretamente da sua biblioteca de origem (eth-typing)
 # para garantir a máxima compatibilidade com linters como o Pylance.
 from eth_typing import ChecksumAddress
-from web3.types import TxReceipt
 
 # Usa o logger centralizado configurado em utils.config
 logger = logging.getLogger("bot_zeus")
@@ -20,23 +20,30 @@ class NonceManager:
     """
     Uma classe para gerenciar o nonce de uma carteira de forma segura.
 
-    Mantém um contador de nonce local que é incrementado após cada transação bem-sucedida
+    Mantém um contador de nonce local que é reservado/incrementado a cada transação
     e pode ser ressincronizado com a rede para garantir consistência.
     """
 
-    def __init__(self, web3: Web3, wallet_address: str):
+    def __init__(self, web3: Web3, wallet_address: str, nonce_inicial: int | None = None):
         """
         Inicializa o NonceManager.
 
         Args:
             web3: Uma instância Web3 conectada à rede.
             wallet_address: O endereço da carteira para gerenciar o nonce.
+            nonce_inicial: Nonce 'pending' já obtido (ex.: no lote da sonda de arranque);
+                se None, sincroniza com a rede.
         """
         self.web3 = web3
         # A anotação de tipo agora usa o import direto de eth_typing, que resolve o erro.
         self.wallet_address: ChecksumAddress = Web3.to_checksum_address(wallet_address)
         self.nonce: int = -1  # Inicializa com -1 para indicar que ainda não foi sincronizado
-        self.sync_with_network() # Sincroniza o nonce na inicialização
+        self._lock = threading.Lock()
+        if nonce_inicial is not None:
+            self.nonce = nonce_inicial
+            logger.info("Nonce inicial obtido na sonda de arranque: %s", self.nonce)
+        else:
+            self.sync_with_network() # Sincroniza o nonce na inicialização
 
     def get_nonce(self, refresh: bool = False) -> int:
         """
@@ -52,33 +59,50 @@ class NonceManager:
             self.sync_with_network()
         return self.nonce
 
-    def increment_nonce(self) -> None:
-        """Incrementa o nonce local em 1."""
-        self.nonce += 1
-        logger.debug(f"Nonce incrementado localmente para: {self.nonce}")
-
-    def incrementar_se_confirmado(self, tx_receipt: TxReceipt) -> None:
+    def reserve_nonce(self) -> int:
         """
-        Incrementa o nonce somente se a transação for confirmada com sucesso.
-        Se a transação falhar, ressincroniza com a rede para evitar inconsistências.
+        Reserva o próximo nonce de forma otimista: devolve o contador local e
+        incrementa-o atomicamente, sem RPC. Permite assinar/enviar transações em
+        paralelo; em erro de nonce o chamador deve usar sync_with_network().
+
+        Returns:
+            O nonce reservado para a transação.
         """
-        if tx_receipt and tx_receipt.get('status') == 1:
-            self.increment_nonce()
-        else:
-            logger.warning("A transação falhou ou o recibo é inválido. Nonce não será incrementado.")
+        if self.nonce < 0:
+            # Fora do lock: sync_with_network adquire-o para atribuir o valor da rede
             self.sync_with_network()
+        with self._lock:
+            reservado = self.nonce
+            self.nonce += 1
+        logger.debug("Nonce %s reservado (próximo local: %s)", reservado, self.nonce)
+        return reservado
+
+    def increment_nonce(self) -> None:
+        """Incrementa o nonce local em 1."""
+        with self._lock:
+            self.nonce += 1
+        logger.debug("Nonce incrementado localmente para: %s", self.nonce)
 
     def sync_with_network(self) -> None:
         """
         Sincroniza o nonce local com o nonce atual da rede.
         Esta é a única função para buscar o nonce da blockchain.
+        Usa o bloco 'pending' para contar as transações ainda na mempool: uma tx recém-enviada
+        não faz o contador recuar. O valor da rede prevalece (mesmo abaixo do local), pois esta
+        sincronização corre após erros em que um nonce reservado pode não ter sido usado.
+        A RPC corre fora do lock (não bloqueia reserve_nonce); só a atribuição é feita sob ele.
         """
         try:
-            self.nonce = self.web3.eth.get_transaction_count(self.wallet_address)
-            logger.info(f"Nonce sincronizado com a rede: {self.nonce}")
+            nonce_rede = self.web3.eth.get_transaction_count(self.wallet_address, 'pending')
         except Exception as e:
-            logger.critical(f"Erro crítico ao sincronizar nonce com a rede para o endereço {self.wallet_address}: {e}", exc_info=True)
+            logger.critical(
+                "Erro crítico ao sincronizar nonce com a rede para o endereço %s: %s",
+                self.wallet_address, e, exc_info=True,
+            )
             # Em caso de falha crítica, não podemos prosseguir com transações
             raise RuntimeError("Não foi possível obter o nonce da rede.")
+        with self._lock:
+            self.nonce = nonce_rede
+        logger.info("Nonce sincronizado com a rede: %s", nonce_rede)
 
 # A função 'reset_nonce' foi removida por ser redundante com 'sync_with_network'.
@@ -5,10 +5,7 @@ Este módulo contém as funções que calculam o tamanho ideal de uma transaçã
 para maximizar o lucro, com base na liquidez disponível em dois pools de DEXs.
 """
 
-from decimal import Decimal, getcontext
-
-# Aumenta a precisão para cálculos financeiros
-getcontext().prec = 50
+from math import isqrt
 
 def calcular_quantidade_otima(
     reserva_in_dex_a: int,
@@ -33,23 +30,15 @@ def calcular_quantidade_otima(
         A quantidade ótima de 'token_in' a ser usada no flash loan, na sua unidade base (wei).
         Retorna 0 se não houver uma oportunidade de arbitragem.
     """
-    # Converter para Decimal para precisão
-    r_in_a = Decimal(reserva_in_dex_a)
-    r_out_a = Decimal(reserva_out_dex_a)
-    r_in_b = Decimal(reserva_in_dex_b)
-    r_out_b = Decimal(reserva_out_dex_b)
-
-    # Fórmula para a quantidade ótima de entrada (amount_in)
+    # Aritmética inteira exata: as reservas já são inteiros (uint112), e isqrt trata o
+    # produto de ~224 bits sem perda de precisão (sem Decimal nem alteração do contexto global)
     # amount_in = (sqrt(reserve_in_A * reserve_out_B * reserve_in_B * reserve_out_A) - (reserve_in_A * reserve_out_B)) / (reserve_in_A + reserve_in_B)
-    
-    numerador = (r_in_a * r_out_b * r_in_b * r_out_a).sqrt() - (r_in_a * r_out_b)
-    denominador = r_in_a + r_in_b
+    produto_cruzado = reserva_in_dex_a * reserva_out_dex_b
+    numerador = isqrt(produto_cruzado * reserva_in_dex_b * reserva_out_dex_a) - produto_cruzado
+    denominador = reserva_in_dex_a + reserva_in_dex_b
 
     # Se o numerador for negativo, significa que não há oportunidade de arbitragem nessa direção
     if numerador <= 0 or denominador <= 0:
         return 0
 
-    quantidade_otima = numerador / denominador
-    
-    return int(quantidade_otima)
-
+    return numerador // denominador
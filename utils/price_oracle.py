@@ -11,13 +11,15 @@ import sys
 from decimal import Decimal
 from web3 import Web3
 import time
+import threading
 
 # --- Configuração de Caminhos e Importações ---
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(base_dir)
 
-from utils.config import config
-from utils.liquidity_utils import obter_preco_saida
+from utils.config import config, enviar_lote_rpc
+from utils.gas_utils import taxa_gas_expirada, registar_taxa_gas
+from utils.liquidity_utils import obter_preco_saida, calldata_get_amounts_out
 
 # --- Variáveis Globais do Módulo ---
 web3: Web3 = config['web3']
@@ -27,7 +29,19 @@ WMATIC_ADDRESS = config['TOKENS']['wmatic']['address']
 USDC_ADDRESS = config['TOKENS']['usdc']['address']
 
 # Cache simples para o preço do MATIC para evitar chamadas excessivas à API
-_preco_matic_cache = {'preco': Decimal(0), 'timestamp': 0}
+PRECO_MATIC_VALIDADE_SEC = 30
+# Se a renovação falhar, o último preço bom continua a servir durante esta janela (em vez de 0,
+# que faria o cálculo de lucro descartar oportunidades válidas)
+PRECO_MATIC_GRACE_SEC = float(os.getenv("PRECO_MATIC_GRACE_SEC", "300"))
+# Após uma renovação falhada, a próxima tentativa só acontece passado este intervalo (as threads
+# de varredura servem-se do cache entretanto, sem repetir a RPC nem o aviso)
+PRECO_MATIC_RETRY_SEC = 5
+# Com chave Polygonscan o gás vem da API, não do nó: sondar_custos_lucro nada poupa (lida uma vez)
+POLYGONSCAN_API_KEY = os.getenv("POLYGONSCAN_API_KEY")
+_preco_matic_cache = {'preco': Decimal(0), 'expira_em': 0.0, 'obtido_em': 0.0, 'em_falha': False}
+# Os workers de varredura são threads do mesmo processo e já partilham o cache; o lock garante
+# que, na expiração, só uma thread consulta a DEX enquanto as restantes aguardam o novo valor.
+_preco_matic_lock = threading.Lock()
 
 def obter_preco_matic_em_usdc() -> Decimal:
     """
@@ -35,15 +49,24 @@ def obter_preco_matic_em_usdc() -> Decimal:
     Utiliza um cache de 30 segundos para otimizar o desempenho.
 
     Returns:
-        O preço de 1 WMATIC em USDC como um objeto Decimal, ou Decimal(0) em caso de erro.
+        O preço de 1 WMATIC em USDC como um objeto Decimal. Em caso de erro, o último preço
+        válido se tiver menos de PRECO_MATIC_GRACE_SEC; caso contrário, Decimal(0).
     """
-    cache_validade_segundos = 30
-    agora = int(time.time())
+    cache_validade_segundos = PRECO_MATIC_VALIDADE_SEC
+    agora = time.monotonic()
 
-    # Verifica se o cache é válido
-    if agora - _preco_matic_cache['timestamp'] < cache_validade_segundos:
+    # Verifica se o cache é válido (relógio monotónico: imune a ajustes de NTP)
+    if agora < _preco_matic_cache['expira_em']:
         return _preco_matic_cache['preco']
 
+    with _preco_matic_lock:
+        # Outra thread pode ter renovado o cache enquanto esta aguardava o lock
+        if time.monotonic() < _preco_matic_cache['expira_em']:
+            return _preco_matic_cache['preco']
+        return _atualizar_preco_matic(agora, cache_validade_segundos)
+
+
+def _atualizar_preco_matic(agora: float, cache_validade_segundos: int) -> Decimal:
     try:
         # Consultar o preço de 1 WMATIC (10**18) em USDC (que tem 6 decimais)
         # Usamos uma DEX V2 confiável como a QuickSwap para este oráculo
@@ -58,14 +81,71 @@ def obter_preco_matic_em_usdc() -> Decimal:
             
             # Atualizar o cache
             _preco_matic_cache['preco'] = preco_usdc
-            _preco_matic_cache['timestamp'] = agora
+            _preco_matic_cache['expira_em'] = agora + cache_validade_segundos
+            _preco_matic_cache['obtido_em'] = agora
+            if _preco_matic_cache['em_falha']:
+                _preco_matic_cache['em_falha'] = False
+                logger.info("Preço do MATIC disponível novamente.")
             
-            logger.debug(f"Preço do MATIC atualizado: 1 MATIC = {preco_usdc:.4f} USDC")
+            logger.debug("Preço do MATIC atualizado: 1 MATIC = %.4f USDC", preco_usdc)
             return preco_usdc
         else:
-            return Decimal(0)
+            return _preco_em_falha(agora, "cotação vazia")
 
     except Exception as e:
-        logger.error(f"Erro ao obter o preço do MATIC: {e}")
-        return Decimal(0)
+        return _preco_em_falha(agora, e)
+
 
+def _preco_em_falha(agora: float, causa) -> Decimal:
+    """
+    Renovação falhada: adia a próxima tentativa PRECO_MATIC_RETRY_SEC e devolve o último preço
+    bom dentro da janela de tolerância, ou Decimal(0) se não houver. Avisa uma vez por falha.
+    """
+    preco = _preco_matic_cache['preco']
+    if preco > 0 and agora - _preco_matic_cache['obtido_em'] > PRECO_MATIC_GRACE_SEC:
+        # Fora da janela: o valor em cache deixa de ser servido, também pelo caminho rápido
+        preco = _preco_matic_cache['preco'] = Decimal(0)
+    _preco_matic_cache['expira_em'] = agora + PRECO_MATIC_RETRY_SEC
+    if not _preco_matic_cache['em_falha']:
+        _preco_matic_cache['em_falha'] = True
+        if preco > 0:
+            logger.warning(
+                "Preço do MATIC indisponível (%s); a usar o último valor (%.4f USDC, há %.0fs).",
+                causa, preco, agora - _preco_matic_cache['obtido_em'],
+            )
+        else:
+            logger.error("Erro ao obter o preço do MATIC: %s", causa)
+    return preco
+
+
+def sondar_custos_lucro(web3_instance: Web3) -> None:
+    """Renova gás e preço do MATIC num só lote JSON-RPC quando ambos os caches expiraram
+    (só sem POLYGONSCAN_API_KEY e sem renovação de gás em curso); senão retorna sem RPCs."""
+    if POLYGONSCAN_API_KEY or not taxa_gas_expirada():
+        return
+    if time.monotonic() < _preco_matic_cache['expira_em']:
+        return
+    with _preco_matic_lock:
+        agora = time.monotonic()
+        if agora < _preco_matic_cache['expira_em']:
+            return
+        try:
+            router_address = config['dex_contracts']['QuickSwapV2']['router'].address
+            calldata = calldata_get_amounts_out(10**18, [WMATIC_ADDRESS, USDC_ADDRESS])
+            gas_hex, amounts_hex = enviar_lote_rpc(web3_instance, [
+                ("eth_gasPrice", []),
+                ("eth_call", [{"to": router_address, "data": "0x" + calldata.hex()}, "latest"]),
+            ])
+        except Exception as e:
+            logger.debug("Lote gás+oracle indisponível (%s); a consultar separadamente.", e)
+            return
+        if gas_hex:
+            registar_taxa_gas(int(gas_hex, 16) / 10**9)
+        # uint256[] devolvido: offset, comprimento, amounts[0], amounts[1] (saída em USDC)
+        retorno = bytes.fromhex(amounts_hex[2:]) if amounts_hex else b""
+        preco_usdc_base = int.from_bytes(retorno[96:128], 'big') if len(retorno) >= 128 else 0
+        if preco_usdc_base > 0:
+            _preco_matic_cache['preco'] = config['from_base'](web3_instance, preco_usdc_base, USDC_ADDRESS)
+            _preco_matic_cache['expira_em'] = agora + PRECO_MATIC_VALIDADE_SEC
+            _preco_matic_cache['obtido_em'] = agora
+            _preco_matic_cache['em_falha'] = False
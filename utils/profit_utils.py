@@ -1,6 +1,25 @@
+import logging
 from decimal import Decimal
 from typing import Callable, Any
 
+# Constantes construídas uma vez (e não a cada cálculo); fonte única, importada por arbitrage
+TAXA_FLASH_LOAN = Decimal("0.0009")
+# A mesma taxa em pontos-base, para a rejeição rápida em aritmética inteira
+TAXA_FLASH_LOAN_BPS = 9
+# Escala de basis points (taxas, slippage) para cálculos só com inteiros
+BPS_SCALE = 10_000
+# Escalas de unidade pré-construídas: gwei -> wei e wei -> MATIC sem web3.to_wei/from_wei por cálculo
+WEI_POR_GWEI = Decimal(10**9)
+WEI_POR_MATIC = Decimal(10**18)
+
+
+def nao_cobre_taxa_flash_loan(lucro_bruto_base: int, quantidade_emprestimo_base: int) -> bool:
+    """
+    True se o lucro bruto não cobre o limite inferior da taxa do flash loan (unidade base):
+    o lucro líquido nunca seria positivo. Rejeição em inteiros, sem Decimal, gás nem oracle.
+    """
+    return lucro_bruto_base <= (quantidade_emprestimo_base * TAXA_FLASH_LOAN_BPS) // BPS_SCALE
+
 # Types for readability
 FromBaseFn = Callable[[Any, int, str], Decimal]
 GetGasFn = Callable[[Any, Any], float]  # obter_taxa_gas(web3, logger) -> gwei float
@@ -26,7 +45,8 @@ def calcular_lucro_liquido_esperado(
 
     Dependências são injetadas por parâmetro para facilitar testes unitários.
     """
-    TAXA_FLASH_LOAN = Decimal("0.0009")
+    if nao_cobre_taxa_flash_loan(lucro_bruto_base, quantidade_emprestimo_base):
+        return Decimal("-inf")
 
     lucro_bruto = from_base(web3, lucro_bruto_base, token_emprestimo_address)
     quantidade_emprestimo = from_base(web3, quantidade_emprestimo_base, token_emprestimo_address)
@@ -42,17 +62,15 @@ def calcular_lucro_liquido_esperado(
         )
         return Decimal("-inf")  # Sinaliza inviabilidade de cálculo
 
-    gas_price_wei = web3.to_wei(preco_gas_gwei, 'gwei')
-    custo_gas_wei = int(gas_limit) * int(gas_price_wei)
-    custo_gas_matic = web3.from_wei(custo_gas_wei, 'ether')
+    gas_price_wei = int(preco_gas_gwei * WEI_POR_GWEI)
+    custo_gas_wei = int(gas_limit) * gas_price_wei
+    custo_gas_matic = Decimal(custo_gas_wei) / WEI_POR_MATIC
     custo_gas_usdc = custo_gas_matic * preco_matic_usdc
 
     lucro_liquido = lucro_bruto - custo_flash_loan - custo_gas_usdc
-    try:
+    if logger.isEnabledFor(logging.DEBUG):
         logger.debug(
             "Cálculo de Lucro: Bruto=%.4f, Custo FlashLoan=%.4f, Custo Gás=%.4f -> Líquido=%.4f",
             float(lucro_bruto), float(custo_flash_loan), float(custo_gas_usdc), float(lucro_liquido)
         )
-    except Exception:
-        pass
     return lucro_liquido
@@ -7,25 +7,56 @@ dos contratos e do NonceManager, mantendo o dicionário `config` coerente.
 
 from __future__ import annotations
 
+import asyncio
 import os
+import queue
+import threading
 import time
 import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# orjson (opcional) para serializar as métricas; stdlib como fallback
+try:
+	import orjson
+	def _json_linha(obj) -> bytes:
+		return orjson.dumps(obj) + b"\n"
+except ImportError:
+	def _json_linha(obj) -> bytes:
+		return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
 from typing import Optional, Dict
 
 from web3 import Web3
-from web3.middleware.geth_poa import geth_poa_middleware
 
 # Import do módulo de configuração completo para poder atualizar seus globais
 import utils.config as cfg
 from utils.nonce_utils import NonceManager
 
+# Intervalos (cooldowns, períodos) medidos com time.monotonic(): imunes a ajustes do relógio
 _last_failover_ts: float = 0.0
 _failover_min_interval_sec: int = 120  # evitar flip-flop
 _last_primary_try_ts: float = 0.0
 _primary_try_cooldown_sec_default: int = 600
+_primary_try_cooldown_max_sec: int = 3600
+_primary_fail_streak: int = 0
+
+# Número do bloco em cache curto: várias leituras no mesmo intervalo partilham um eth_blockNumber.
+# A geração muda a cada troca de provider, invalidando o valor lido no nó anterior.
+_BLOCK_NUMBER_TTL_SEC = float(os.getenv("BLOCK_NUMBER_TTL_SEC", "0.5"))
+_block_number_cache: dict = {"geracao": -1, "valor": 0, "expira_em": 0.0}
+_geracao_provider: int = 0
+
+# Último bloco recebido por subscrição (eth_subscribe newHeads) no WS_URL, o endpoint WebSocket
+# do mesmo nó que CUSTOM_RPC_URL. Com esse provider ativo e cabeçalhos recentes, o número do
+# bloco vem daqui, sem eth_blockNumber.
+_HEAD_MAX_IDADE_SEC = float(os.getenv("NEW_HEADS_MAX_AGE_SEC", "10"))
+_ultimo_head: dict = {"url": None, "num": None, "ts": 0.0}
+_thread_heads: Optional[threading.Thread] = None
 
 # Telemetria leve
 _metrics: Dict[str, dict] = {}
+# Espelho de _metrics já arredondado para o log, atualizado na escrita (o log só formata)
+_metrics_resumo: Dict[str, dict] = {}
 _last_metrics_log: float = 0.0
 _metrics_log_period_sec: int = 60
 _metrics_persist_default: bool = False
@@ -34,6 +65,8 @@ _metrics_persist_period_sec_default: int = 60
 # Tornar símbolos explicitamente exportados (ajuda o Pylance)
 __all__ = [
 	"try_failover",
+	"cached_block_number",
+	"iniciar_monitor_new_heads",
 	"maybe_failover_if_stale",
 	"maybe_return_to_preferred",
 	"record_switch",
@@ -45,33 +78,99 @@ __all__ = [
 
 
 def _provider_candidates() -> list[str]:
-	# Ordem de preferência: CUSTOM -> INFURA (pode expandir no futuro)
+	# Ordem de preferência: CUSTOM -> INFURA (pode expandir no futuro). Só HTTP: WS_URL serve
+	# apenas a subscrição newHeads (o WebsocketProvider não é seguro entre threads)
 	cands = [
 		os.getenv("CUSTOM_RPC_URL"),
 		os.getenv("INFURA_URL"),
 	]
-	return [c for c in cands if c]
+	return [c for c in cands if c and c.startswith(("http://", "https://"))]
+
+
+# Instâncias Web3 por URL: voltar a um provider já usado reaproveita a instância e, com ela,
+# os contratos em cache de cfg.carregar_contrato (sem reconstrução no hot-switch)
+_web3_por_url: Dict[str, Web3] = {cfg.chosen_url: cfg.web3_instance} if getattr(cfg, "chosen_url", None) else {}
 
 
 def _build_web3(url: str) -> Optional[Web3]:
 	try:
-		timeout = float(os.getenv("RPC_TIMEOUT_SECONDS", "10"))
-		w3 = Web3(Web3.HTTPProvider(endpoint_uri=url, request_kwargs={"timeout": timeout}))
-		w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-		if not w3.is_connected():
-			return None
-		# smoke: block number
+		w3 = _web3_por_url.get(url) or cfg.construir_web3(url)
+		# Uma só RPC de sonda: eth_blockNumber a responder já prova a ligação (sem is_connected).
+		# Não usar chain_id: a cache simples por instância responderia sem tocar no endpoint.
 		_ = w3.eth.block_number
+		_web3_por_url[url] = w3
 		return w3
 	except Exception:
 		return None
 
 
+def cached_block_number() -> int:
+	"""eth_blockNumber do provider ativo, reutilizado durante BLOCK_NUMBER_TTL_SEC."""
+	agora = time.monotonic()
+	head = _ultimo_head
+	if (
+		head["num"] is not None
+		and agora - head["ts"] < _HEAD_MAX_IDADE_SEC
+		and getattr(cfg, "chosen_url", None) == os.getenv("CUSTOM_RPC_URL")
+	):
+		return head["num"]
+	ent = _block_number_cache
+	if ent["geracao"] == _geracao_provider and agora < ent["expira_em"]:
+		return ent["valor"]
+	valor = int(cfg.config["web3"].eth.block_number)
+	_block_number_cache.update(geracao=_geracao_provider, valor=valor, expira_em=agora + _BLOCK_NUMBER_TTL_SEC)
+	return valor
+
+
+def iniciar_monitor_new_heads(ws_url: Optional[str] = None) -> bool:
+	"""Subscreve newHeads no WS_URL numa thread própria; False se não houver URL WebSocket.
+
+	Sem subscrição ativa (ou com cabeçalhos atrasados), cached_block_number volta a consultar
+	eth_blockNumber e a deteção de estagnação segue pelo polling habitual.
+	"""
+	global _thread_heads
+	url = ws_url or os.getenv("WS_URL")
+	if not url or not url.startswith(("ws://", "wss://")):
+		return False
+	if _thread_heads is None:
+		_thread_heads = threading.Thread(
+			target=lambda: asyncio.run(_escutar_new_heads(url)), name="rpc-new-heads", daemon=True
+		)
+		_thread_heads.start()
+	return True
+
+
+async def _escutar_new_heads(url: str):
+	"""Mantém a subscrição newHeads, com religação em backoff exponencial (até 60s)."""
+	import websockets  # dependência do web3 (WebsocketProvider)
+	espera = 1.0
+	while True:
+		try:
+			async with websockets.connect(url, ping_interval=20, max_size=None) as ws:
+				await ws.send(json.dumps({"jsonrpc": "2.0", "id": 1, "method": "eth_subscribe", "params": ["newHeads"]}))
+				resposta = json.loads(await ws.recv())
+				if "result" not in resposta:
+					raise ValueError(f"eth_subscribe recusado: {resposta.get('error')}")
+				cfg.logger.info("Subscrição newHeads ativa em %s.", url)
+				espera = 1.0
+				async for mensagem in ws:
+					head = json.loads(mensagem).get("params", {}).get("result") or {}
+					numero = head.get("number")
+					if numero:
+						_ultimo_head.update(url=url, num=int(numero, 16), ts=time.monotonic())
+		except Exception as e:
+			cfg.logger.debug("Subscrição newHeads interrompida (%s); nova tentativa em %.0fs.", e, espera)
+		await asyncio.sleep(espera)
+		espera = min(espera * 2, 60.0)
+
+
 def _hot_switch(new_w3: Web3, new_url: str) -> bool:
 	"""Troca o provider em runtime, reconstroi NonceManager e contratos."""
+	global _geracao_provider
 	logger = cfg.logger
 	try:
 		# 1) Atualizar instância Web3 global no módulo cfg e no dict config
+		_geracao_provider += 1
 		cfg.web3_instance = new_w3
 		cfg.chosen_url = new_url
 		cfg.config["web3"] = new_w3
@@ -93,18 +192,22 @@ def _hot_switch(new_w3: Web3, new_url: str) -> bool:
 			"UniswapV3": {
 				"router": uniswap_v3_router,
 				"quoter": uniswap_v3_quoter,
+				"swap_fn_name": "exactInputSingle",
 			},
 			"SushiSwapV2": {
 				"router": sushiswap_router,
 				"factory": sushiswap_factory,
 				"pair_abi_name": "SushiswapV2Pair.json",
+				"swap_fn_name": "swapExactTokensForTokens",
 			},
 			"QuickSwapV2": {
 				"router": quickswap_router,
 				"factory": quickswap_factory,
 				"pair_abi_name": "QuickswapV2Pair.json",
+				"swap_fn_name": "swapExactTokensForTokens",
 			},
 		}
+		cfg.vincular_funcoes_dex(dex_contracts)
 		cfg.dex_contracts = dex_contracts
 		cfg.config["dex_contracts"] = dex_contracts
 
@@ -129,7 +232,7 @@ def try_failover(logger=None) -> bool:
 	"""Tenta alternar para um provider alternativo, respeitando cooldown."""
 	global _last_failover_ts
 	lg = logger or cfg.logger
-	now = time.time()
+	now = time.monotonic()
 	if (now - _last_failover_ts) < _failover_min_interval_sec:
 		lg.info("Failover ignorado (cooldown ativo).")
 		return False
@@ -140,15 +243,29 @@ def try_failover(logger=None) -> bool:
 		lg.warning("Sem providers alternativos disponíveis para failover.")
 		return False
 
-	for url in cands:
-		lg.info("Testando provider alternativo: %s", url)
+	# Candidatos testados em paralelo: adota-se o primeiro saudável a responder
+	# (latência do failover ~ min(RTT) em vez da soma das sondas sequenciais)
+	lg.info("Testando providers alternativos em paralelo: %s", cands)
+
+	def _sondar(url: str):
+		inicio = time.monotonic()
 		w3 = _build_web3(url)
-		if w3 is None:
-			lg.warning("Provider alternativo não conectou: %s", url)
-			continue
-		if _hot_switch(w3, url):
-			_last_failover_ts = now
-			return True
+		return url, w3, (time.monotonic() - inicio) * 1000.0
+
+	executor = ThreadPoolExecutor(max_workers=len(cands), thread_name_prefix="failover")
+	try:
+		for futuro in as_completed([executor.submit(_sondar, url) for url in cands]):
+			url, w3, latencia_ms = futuro.result()
+			if w3 is None:
+				lg.warning("Provider alternativo não conectou: %s", url)
+				continue
+			record_ping(latencia_ms, url)
+			if _hot_switch(w3, url):
+				_last_failover_ts = now
+				return True
+	finally:
+		# Não esperar pelas sondas mais lentas depois de escolhido o vencedor
+		executor.shutdown(wait=False, cancel_futures=True)
 
 	lg.error("Failover não conseguiu alternar para nenhum provider válido.")
 	return False
@@ -156,23 +273,18 @@ def try_failover(logger=None) -> bool:
 
 def maybe_failover_if_stale(max_stale_seconds: int = 120) -> bool:
 	"""Se o bloco não avançar por mais de N segundos, tenta failover."""
-	try:
-		w3 = cfg.config["web3"]
-		# Leitura simples de bloco; se desconectar, _build_web3 já cuida
-		_ = w3.eth.block_number
-	except Exception:
-		# Desconexão ou erro temporário: tentar failover
-		return try_failover()
 	# A decisão de 'stale' deve ser tomada no chamador, que acompanha o último bloco.
-	# Este helper apenas oferece a ação de failover quando chamada.
+	# Este helper apenas oferece a ação de failover quando chamada (sem reler o bloco:
+	# com ou sem resposta do nó, o resultado seria o mesmo).
 	return try_failover()
 
 
 def maybe_return_to_preferred(logger=None) -> bool:
 	"""Se não estamos no provider preferido (CUSTOM), tenta voltar quando ele estiver saudável.
-	Respeita um cooldown configurável via RETURN_TO_PRIMARY_COOLDOWN_SEC.
+	Respeita um cooldown configurável via RETURN_TO_PRIMARY_COOLDOWN_SEC, que duplica a cada
+	sonda falhada (até 1h) e volta ao valor base quando o provider responde.
 	"""
-	global _last_primary_try_ts
+	global _last_primary_try_ts, _primary_fail_streak
 	lg = logger or cfg.logger
 	preferred = os.getenv("CUSTOM_RPC_URL")
 	if not preferred:
@@ -180,16 +292,25 @@ def maybe_return_to_preferred(logger=None) -> bool:
 	current = getattr(cfg, "chosen_url", None)
 	if current == preferred:
 		return False
-	cooldown = int(os.getenv("RETURN_TO_PRIMARY_COOLDOWN_SEC", str(_primary_try_cooldown_sec_default)))
-	now = time.time()
+	# Backoff exponencial: cada sonda falhada duplica o intervalo até à próxima (teto de 1h)
+	base = int(os.getenv("RETURN_TO_PRIMARY_COOLDOWN_SEC", str(_primary_try_cooldown_sec_default)))
+	cooldown = min(base * 2 ** _primary_fail_streak, _primary_try_cooldown_max_sec)
+	now = time.monotonic()
 	if (now - _last_primary_try_ts) < cooldown:
 		return False
 	_last_primary_try_ts = now
 	lg.info("Verificando reentrada no provider preferido...")
 	w3 = _build_web3(preferred)
+	latencia_ms = (time.monotonic() - now) * 1000.0
 	if w3 is None:
-		lg.info("Provider preferido ainda indisponível.")
+		_primary_fail_streak += 1
+		lg.info(
+			"Provider preferido ainda indisponível. Próxima tentativa em %ss.",
+			min(base * 2 ** _primary_fail_streak, _primary_try_cooldown_max_sec),
+		)
 		return False
+	_primary_fail_streak = 0
+	record_ping(latencia_ms, preferred)
 	ok = _hot_switch(w3, preferred)
 	if ok:
 		lg.info("Reentrada aplicada: voltamos ao provider preferido.")
@@ -199,6 +320,7 @@ def maybe_return_to_preferred(logger=None) -> bool:
 def _get_metrics(url: str) -> dict:
 	if url not in _metrics:
 		_metrics[url] = {"pings": 0, "avg_ms": 0.0, "last_ms": 0.0, "fails": 0, "switches": 0}
+		_metrics_resumo[url] = dict(_metrics[url])
 	return _metrics[url]
 
 
@@ -206,6 +328,7 @@ def record_switch(url: Optional[str] = None):
 	url_val: str = url if isinstance(url, str) and url else (getattr(cfg, "chosen_url", None) or "unknown")
 	m = _get_metrics(url_val)
 	m["switches"] += 1
+	_metrics_resumo[url_val]["switches"] = m["switches"]
 
 
 def record_ping(latency_ms: float, url: Optional[str] = None):
@@ -219,12 +342,17 @@ def record_ping(latency_ms: float, url: Optional[str] = None):
 		m["avg_ms"] = alpha * latency_ms + (1 - alpha) * m["avg_ms"]
 	m["last_ms"] = latency_ms
 	m["pings"] += 1
+	resumo = _metrics_resumo[url_val]
+	resumo["avg_ms"] = round(m["avg_ms"], 1)
+	resumo["last_ms"] = round(latency_ms, 1)
+	resumo["pings"] = m["pings"]
 
 
 def record_fail(url: Optional[str] = None):
 	url_val: str = url if isinstance(url, str) and url else (getattr(cfg, "chosen_url", None) or "unknown")
 	m = _get_metrics(url_val)
 	m["fails"] += 1
+	_metrics_resumo[url_val]["fails"] = m["fails"]
 
 
 def log_metrics_if_due(logger=None, period_sec: Optional[int] = None):
@@ -237,7 +365,7 @@ def log_metrics_if_due(logger=None, period_sec: Optional[int] = None):
 	except Exception:
 		env_period_val = None
 	period = period_sec or env_period_val or _metrics_log_period_sec
-	now = time.time()
+	now = time.monotonic()
 	# Se não há métricas ainda, não atualizar o relógio para não bloquear o próximo ciclo
 	if not _metrics:
 		return
@@ -245,10 +373,11 @@ def log_metrics_if_due(logger=None, period_sec: Optional[int] = None):
 		return
 	# Só aqui marcamos o último log
 	_last_metrics_log = now
-	try:
-		lg.info("RPC métricas: %s", {k: {"pings": v["pings"], "avg_ms": round(v["avg_ms"],1), "last_ms": round(v["last_ms"],1), "fails": v["fails"], "switches": v["switches"]} for k,v in _metrics.items()})
-	except Exception:
-		pass
+	if lg.isEnabledFor(logging.INFO):
+		try:
+			lg.info("RPC métricas: %s", _metrics_resumo)
+		except Exception:
+			pass
 	# Persistência opcional em JSON
 	try:
 		persist_enabled = os.getenv("METRICS_PERSIST", "0").lower() in ("1","true","yes","on")
@@ -258,28 +387,108 @@ def log_metrics_if_due(logger=None, period_sec: Optional[int] = None):
 		pass
 
 
+def _flusher_metricas():
+	"""Thread de escrita: agrupa as linhas pendentes (até 1s ou 50 registos) numa só escrita por ficheiro."""
+	while True:
+		item = _fila_metricas.get()
+		lote = [item]
+		limite = time.monotonic() + 1.0
+		while item is not None and len(lote) < 50:
+			restante = limite - time.monotonic()
+			if restante <= 0:
+				break
+			try:
+				item = _fila_metricas.get(timeout=restante)
+			except queue.Empty:
+				break
+			lote.append(item)
+		por_ficheiro: Dict[str, list] = {}
+		for entrada in lote:
+			if entrada is not None:
+				por_ficheiro.setdefault(entrada[0], []).append(entrada[1])
+		for file_path, linhas in por_ficheiro.items():
+			try:
+				os.write(_fd_metricas(file_path), b"".join(linhas))
+			except Exception:
+				# Não falhar o bot por erro de IO de métricas; reabrir o ficheiro na próxima escrita
+				_fechar_fd_metricas(file_path)
+		if lote[-1] is None:
+			for file_path in list(_fds_metricas):
+				_fechar_fd_metricas(file_path)
+			return
+
+
+# Descritores em modo append mantidos abertos pela thread de escrita (um por ficheiro):
+# cada lote é um único os.write, sem open/close nem buffer do objeto ficheiro
+_fds_metricas: Dict[str, int] = {}
+
+
+def _fd_metricas(file_path: str) -> int:
+	fd = _fds_metricas.get(file_path)
+	if fd is None:
+		os.makedirs(os.path.dirname(file_path), exist_ok=True)
+		fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+		_fds_metricas[file_path] = fd
+	return fd
+
+
+def _fechar_fd_metricas(file_path: str) -> None:
+	fd = _fds_metricas.pop(file_path, None)
+	if fd is not None:
+		try:
+			os.close(fd)
+		except OSError:
+			pass
+
+
+_fila_metricas: "queue.Queue[tuple[str, bytes] | None]" = queue.Queue(maxsize=256)
+_thread_metricas: Optional[threading.Thread] = None
+_thread_metricas_lock = threading.Lock()
+
+
+def _garantir_flusher():
+	global _thread_metricas
+	if _thread_metricas is None:
+		with _thread_metricas_lock:
+			if _thread_metricas is None:
+				_thread_metricas = threading.Thread(target=_flusher_metricas, name="rpc-metrics-flusher", daemon=True)
+				_thread_metricas.start()
+
+
 def persist_metrics(path: Optional[str] = None):
-	"""Persiste as métricas atuais em logs/rpc_metrics.json (JSON Lines)."""
+	"""Persiste as métricas atuais em logs/rpc_metrics.json (JSON Lines).
+
+	Apenas serializa um instantâneo e enfileira-o: a escrita em disco é feita pela thread
+	de escrita, fora do caminho de health-check/failover.
+	"""
 	try:
 		base_dir = getattr(cfg, "BASE_DIR", os.getcwd())
-		logs_dir = os.path.join(base_dir, "logs")
-		os.makedirs(logs_dir, exist_ok=True)
-		file_path = path or os.path.join(logs_dir, "rpc_metrics.json")
+		file_path = path or os.path.join(base_dir, "logs", "rpc_metrics.json")
 		payload = {
 			"ts": time.time(),
 			"chosen_url": getattr(cfg, "chosen_url", None),
 			"metrics": _metrics,
 		}
-		with open(file_path, "a", encoding="utf-8") as f:
-			f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+		_garantir_flusher()
+		_fila_metricas.put_nowait((file_path, _json_linha(payload)))
 	except Exception:
-		# Não falhar o bot por erro de IO de métricas
+		# Fila cheia ou erro de serialização: descartar este instantâneo
 		pass
 
+
+def _encerrar_metricas():
+	"""No encerramento: enfileira o último instantâneo e espera (até 2s) que a fila seja escrita."""
+	persist_metrics()
+	if _thread_metricas is not None:
+		try:
+			_fila_metricas.put(None, timeout=1.0)
+			_thread_metricas.join(timeout=2.0)
+		except Exception:
+			pass
+
 # Flush de métricas no encerramento do processo
 try:
 	import atexit
-	atexit.register(lambda: persist_metrics())
+	atexit.register(_encerrar_metricas)
 except Exception:
 	pass
-
@@ -0,0 +1,50 @@
+"""
+Cache persistente (em disco) dos decimais de tokens ERC20.
+
+Os decimais de um token nunca mudam: depois da primeira leitura on-chain ficam
+gravados em cache/token_decimals.json e são reutilizados nos arranques seguintes.
+
+Funções:
+    carregar() -> dict[str, int]:
+        Lê o cache do disco ({endereço checksum: decimais}); vazio se não existir ou estiver corrompido.
+    salvar(decimais_por_token) -> None:
+        Acrescenta entradas ao cache e regrava o ficheiro de forma atómica.
+"""
+import json
+import os
+import threading
+
+from utils.abi_utils import _json_loads
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_PATH = os.path.join(BASE_DIR, "cache", "token_decimals.json")
+
+_lock = threading.Lock()
+_em_disco: dict[str, int] = {}
+
+
+def carregar() -> dict[str, int]:
+    try:
+        with open(CACHE_PATH, "rb") as f:
+            dados = _json_loads(f.read())
+        _em_disco.update({str(k): int(v) for k, v in dados.items()})
+    except (OSError, ValueError, AttributeError):
+        pass
+    return dict(_em_disco)
+
+
+def salvar(decimais_por_token: dict[str, int]) -> None:
+    novos = {k: v for k, v in decimais_por_token.items() if _em_disco.get(k) != v}
+    if not novos:
+        return
+    with _lock:
+        _em_disco.update(novos)
+        try:
+            os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+            temporario = CACHE_PATH + ".tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(_em_disco, f, indent=2, sort_keys=True)
+            os.replace(temporario, CACHE_PATH)
+        except OSError:
+            # Cache é apenas otimização: falhar a escrita não deve interromper o bot
+            pass
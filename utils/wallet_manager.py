@@ -8,7 +8,9 @@ de tokens estáveis para a moeda nativa da rede (MATIC) para pagar taxas de gás
 
 import os
 import sys
+from collections import namedtuple
 from decimal import Decimal
+from functools import lru_cache
 from web3 import Web3
 from eth_typing import ChecksumAddress
 
@@ -16,105 +18,133 @@ from eth_typing import ChecksumAddress
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(base_dir)
 
-from utils.config import config
+from utils.config import config, enviar_lote_rpc
+from utils.multicall_utils import aggregate3, obter_multicall
+from utils.profit_utils import WEI_POR_MATIC
 
 # --- Variáveis Globais do Módulo ---
 logger = config['logger']
+TOKENS = config.get('TOKENS', {})
+from_base = config['from_base']
+to_base = config['to_base']
 
 def _erc20_balance(web3: Web3, token_address: str, wallet_address: ChecksumAddress) -> int:
     """Obtém saldo base (uint256) de um ERC20 via ABI local."""
     try:
-        abi = config['carregar_abi_localmente']('ERC20.json')
-        token = web3.eth.contract(address=Web3.to_checksum_address(token_address), abi=abi)
-        return token.functions.balanceOf(wallet_address).call()
+        return config['erc20'](web3, token_address).functions.balanceOf(wallet_address).call()
     except Exception as e:
         logger.error(f"Erro ao obter saldo ERC20 {token_address[-6:]}: {e}")
         return 0
 
-def verificar_saldo_matic_suficiente(
-    web3: Web3, 
-    wallet_address: ChecksumAddress, 
-    min_balance_matic: Decimal
-) -> bool:
-    """
-    Verifica se o saldo de MATIC na carteira é suficiente para operar.
+# balanceOf(address): seletor fixo; a calldata é o seletor + o endereço alinhado a 32 bytes
+_BALANCE_OF_SELECTOR = "0x70a08231"
 
-    Args:
-        web3: A instância Web3 conectada à rede.
-        wallet_address: O endereço da carteira a ser verificado.
-        min_balance_matic: O saldo mínimo de MATIC necessário.
+def obter_saldo_token(web3: Web3, token_address: str, wallet_address: ChecksumAddress) -> int:
+    """Saldo ERC20 da carteira na unidade base do token (0 em caso de erro)."""
+    return _erc20_balance(web3, token_address, wallet_address)
 
-    Returns:
-        True se o saldo for suficiente, False caso contrário.
+# getEthBalance(address) do próprio Multicall3: lê o saldo nativo no mesmo eth_call dos balanceOf
+_GET_ETH_BALANCE_SELECTOR = "0x4d2301cc"
+
+EstadoCarteira = namedtuple('EstadoCarteira', ['matic_ok', 'usdc_ok', 'usdt_ok', 'saldos'])
+EstadoCarteira.__doc__ = "Resultado do pre-flight da carteira; 'saldos' mapeia símbolo -> saldo em unidade base (wei para MATIC)."
+
+def _ler_saldos_carteira(web3: Web3, tokens: list[str], wallet_address: ChecksumAddress) -> tuple[int, list[int]]:
+    """
+    Saldo nativo (wei) e saldos ERC20 (unidade base) numa única RPC, todos no mesmo bloco:
+    getEthBalance + balanceOf num aggregate3; se indisponível, um lote JSON-RPC
+    (eth_getBalance + eth_call); em último caso, uma chamada por leitura.
     """
+    endereco = wallet_address[2:].lower().rjust(64, '0')
+    dados = _BALANCE_OF_SELECTOR + endereco
+    if config.get('use_multicall3', True):
+        try:
+            calldata = bytes.fromhex(dados[2:])
+            chamadas = [(obter_multicall(web3).address, bytes.fromhex(_GET_ETH_BALANCE_SELECTOR[2:] + endereco))]
+            chamadas += [(token, calldata) for token in tokens]
+            valores = [
+                int.from_bytes(ret[:32], 'big') if ok and len(ret) >= 32 else 0
+                for ok, ret in aggregate3(web3, chamadas)
+            ]
+            return valores[0], valores[1:]
+        except Exception as e:
+            logger.debug("Multicall3 indisponível para a carteira (%s); a usar lote JSON-RPC.", e)
     try:
-        balance_wei = web3.eth.get_balance(wallet_address)
-        balance_matic = web3.from_wei(balance_wei, 'ether')
-
-        if balance_matic < min_balance_matic:
-            logger.warning(
-                f"Saldo de MATIC ({balance_matic:.4f}) abaixo do mínimo necessário "
-                f"de {min_balance_matic} MATIC. O bot irá pausar."
-            )
-            return False
-        
-        logger.info(f"Saldo de MATIC verificado: {balance_matic:.4f} MATIC.")
-        return True
-
+        resultados = enviar_lote_rpc(web3, [("eth_getBalance", [wallet_address, "latest"])] + [
+            ("eth_call", [{"to": token, "data": dados}, "latest"]) for token in tokens
+        ])
+        if resultados[0] is None:
+            raise ValueError("eth_getBalance sem resultado no lote")
+        valores = [int(r, 16) if r and r != "0x" else 0 for r in resultados]
+        return valores[0], valores[1:]
     except Exception as e:
-        logger.error(f"Erro ao verificar o saldo de MATIC: {e}", exc_info=True)
-        return False
+        logger.debug("Lote da carteira indisponível (%s); a consultar leitura a leitura.", e)
+    return web3.eth.get_balance(wallet_address), [_erc20_balance(web3, token, wallet_address) for token in tokens]
 
+@lru_cache(maxsize=32)
+def _matic_em_wei(quantidade_matic: Decimal) -> int:
+    """Mínimo em MATIC convertido para wei uma vez por valor (o mínimo é fixo no config/.env)."""
+    return int(quantidade_matic * WEI_POR_MATIC)
 
-def verificar_saldo_stables_minimo(
+def verificar_carteira_pronta(
     web3: Web3,
     wallet_address: ChecksumAddress,
-    min_usdc: Decimal = Decimal('1.0'),
-    min_usdt: Decimal = Decimal('1.0'),
-) -> bool:
-    """Valida se há saldo mínimo em USDC/USDT para operações.
-
-    Retorna True se ambos os mínimos forem atendidos (quando endereços existem no config),
-    ou se o token estiver ausente no config (não bloqueia).
+    min_balance_matic: Decimal,
+    min_usdc: Decimal = Decimal('0'),
+    min_usdt: Decimal = Decimal('0'),
+) -> EstadoCarteira:
     """
-    ok = True
-    TOKENS = config.get('TOKENS', {})
-    from_base = config.get('from_base')
+    Pre-flight da carteira numa só ida ao nó: MATIC para gás e, quando o mínimo é positivo,
+    USDC/USDT. Todos os saldos vêm do mesmo bloco.
 
-    # USDC
-    try:
-        usdc_info = TOKENS.get('usdc')
-        if usdc_info:
-            bal_base = _erc20_balance(web3, usdc_info['address'], wallet_address)
-            if callable(from_base):
-                bal = Decimal(str(from_base(web3, bal_base, usdc_info['address'])))
-            else:
-                # Fallback: converter por decimais conhecidos (6 para USDC)
-                bal = Decimal(bal_base) / (Decimal(10) ** int(usdc_info.get('decimals', 6)))
-            if bal < min_usdc:
-                logger.warning(f"Saldo USDC baixo: {bal} < {min_usdc}")
-                ok = False
-    except Exception as e:
-        logger.error(f"Erro ao verificar saldo USDC: {e}")
-        ok = False
+    Args:
+        web3: A instância Web3 conectada à rede.
+        wallet_address: O endereço da carteira a ser verificado.
+        min_balance_matic: O saldo mínimo de MATIC necessário.
+        min_usdc: Mínimo de USDC (0 desativa a verificação).
+        min_usdt: Mínimo de USDT (0 desativa a verificação).
 
-    # USDT
+    Returns:
+        EstadoCarteira(matic_ok, usdc_ok, usdt_ok, saldos). Um estável ausente do config
+        não bloqueia; um erro de leitura marca todas as verificações como falhadas.
+    """
+
+    # Estáveis a verificar: mínimo positivo e endereço presente no config
+    verificar = [
+        (simbolo, info, minimo)
+        for simbolo, minimo in (('usdc', min_usdc), ('usdt', min_usdt))
+        if minimo > 0 and (info := TOKENS.get(simbolo))
+    ]
     try:
-        usdt_info = TOKENS.get('usdt')
-        if usdt_info:
-            bal_base = _erc20_balance(web3, usdt_info['address'], wallet_address)
-            if callable(from_base):
-                bal = Decimal(str(from_base(web3, bal_base, usdt_info['address'])))
-            else:
-                bal = Decimal(bal_base) / (Decimal(10) ** int(usdt_info.get('decimals', 6)))
-            if bal < min_usdt:
-                logger.warning(f"Saldo USDT baixo: {bal} < {min_usdt}")
-                ok = False
+        saldo_wei, saldos_base = _ler_saldos_carteira(web3, [info['address'] for _, info, _ in verificar], wallet_address)
     except Exception as e:
-        logger.error(f"Erro ao verificar saldo USDT: {e}")
-        ok = False
-
-    if ok:
+        logger.error("Erro ao verificar os saldos da carteira: %s", e, exc_info=True)
+        return EstadoCarteira(False, False, False, {})
+
+    saldos = {'matic': saldo_wei}
+    estaveis_ok = {'usdc': True, 'usdt': True}
+
+    # Limiares comparados em inteiros (wei / unidade base); Decimal só para o texto do log
+    matic_ok = saldo_wei >= _matic_em_wei(min_balance_matic)
+    if matic_ok:
+        logger.info("Saldo de MATIC verificado: %.4f MATIC.", Decimal(saldo_wei) / WEI_POR_MATIC)
+    else:
+        logger.warning(
+            "Saldo de MATIC (%.4f) abaixo do mínimo necessário de %s MATIC. O bot irá pausar.",
+            Decimal(saldo_wei) / WEI_POR_MATIC, min_balance_matic
+        )
+
+    for (simbolo, info, minimo), bal_base in zip(verificar, saldos_base):
+        try:
+            saldos[simbolo] = bal_base
+            if bal_base < to_base(web3, minimo, info['address']):
+                bal = from_base(web3, bal_base, info['address'])
+                logger.warning("Saldo %s baixo: %s < %s", simbolo.upper(), bal, minimo)
+                estaveis_ok[simbolo] = False
+        except Exception as e:
+            logger.error("Erro ao verificar saldo %s: %s", simbolo.upper(), e)
+            estaveis_ok[simbolo] = False
+
+    if verificar and all(estaveis_ok.values()):
         logger.info("Saldos mínimos de USDC/USDT verificados.")
-    return ok
-
+    return EstadoCarteira(matic_ok, estaveis_ok['usdc'], estaveis_ok['usdt'], saldos)